@@ -0,0 +1,132 @@
+# Copyright (c) 2018 SMHI, Swedish Meteorological and Hydrological Institute
+# License: MIT License (see LICENSE.txt or http://opensource.org/licenses/mit).
+
+"""
+Sort keys shared by the list, tree and table widgets.
+Keys are memoized per item so that sorting again after a small change only computes keys for the new items.
+"""
+
+import functools
+import locale
+import re
+
+CACHE_SIZE = 2 ** 18
+
+_digits = re.compile(r'(\d+)')
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE, typed=True)
+def _natural_key(value):
+    parts = _digits.split(str(value).lower())
+    parts[1::2] = map(int, parts[1::2])
+    return tuple(parts)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE, typed=True)
+def _int_key(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE, typed=True)
+def _locale_key(value):
+    return locale.strxfrm(str(value))
+
+
+def _memoized(key_function, value):
+    try:
+        return key_function(value)
+    except TypeError:
+        # Unhashable value
+        return key_function.__wrapped__(value)
+
+
+def natural_key(value):
+    """
+    Sort key for natural string order, ex. "st2" < "st10". Case insensitive.
+    :param value:
+    :return:
+    """
+    return _memoized(_natural_key, value)
+
+
+def natural_keys(values):
+    """
+    Returns a list with natural_key for each of the values.
+    :param values: iterable
+    :return:
+    """
+    values = list(values)
+    try:
+        return list(map(_natural_key, values))
+    except TypeError:
+        return list(map(natural_key, values))
+
+
+def int_key(value):
+    """
+    Returns value as int, or None if value can not be converted.
+    :param value:
+    :return:
+    """
+    return _memoized(_int_key, value)
+
+
+def locale_key(value):
+    """
+    Sort key for the string order of the current locale (see locale.setlocale). Call clear_cache if the locale
+    is changed.
+    :param value:
+    :return:
+    """
+    return _memoized(_locale_key, value)
+
+
+def get_sort_key(kind):
+    """
+    :param kind: 'natural', 'int', 'locale' or 'str'
+    :return: key function
+    """
+    if kind == 'str':
+        return str
+    keys = {'natural': natural_key,
+            'int': int_key,
+            'locale': locale_key}
+    if kind not in keys:
+        raise ValueError('Unknown sort key: {}'.format(kind))
+    return keys[kind]
+
+
+def sorted_items(items, kind='natural', reverse=False):
+    """
+    Returns the items sorted with the key given by kind, see get_sort_key.
+    :param items: iterable
+    :param kind:
+    :param reverse:
+    :return: list
+    """
+    if kind == 'int':
+        return sorted_int(items, reverse=reverse)
+    return sorted(items, key=get_sort_key(kind), reverse=reverse)
+
+
+def sorted_int(items, reverse=False):
+    """
+    Returns the items sorted as integers if all items can be converted to int, else in natural order.
+    :param items: iterable
+    :param reverse:
+    :return: list
+    """
+    items = list(items)
+    keys = [int_key(item) for item in items]
+    if None in keys:
+        return sorted(items, key=natural_key, reverse=reverse)
+    order = sorted(range(len(items)), key=keys.__getitem__, reverse=reverse)
+    return [items[index] for index in order]
+
+
+def clear_cache():
+    for key_function in (_natural_key, _int_key, _locale_key):
+        key_function.cache_clear()
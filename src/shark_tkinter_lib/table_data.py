@@ -0,0 +1,1113 @@
+# Copyright (c) 2018 SMHI, Swedish Meteorological and Hydrological Institute
+# License: MIT License (see LICENSE.txt or http://opensource.org/licenses/mit).
+
+import array
+import collections
+import csv
+import itertools
+import operator
+import os
+import re
+
+import numpy as np
+
+from .sort_keys import natural_keys
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+class TableData(object):
+    """
+    Python side storage of the rows shown in a TableWidget.
+    Values are stored column wise (one list per column) with their original types.
+    The widget refers to a row by its index (position) in the store.
+    Each row also has a stable id that does not change when other rows are deleted. The id is used as tree item id.
+    dtypes is a dict with the type used when sorting a column: 'int', 'float', 'datetime', 'natural' or 'str' (default).
+    categorical is a list of columns to store dictionary encoded (see CategoricalColumn), or 'auto' to encode the
+    columns that only hold strings with at most max_categories distinct values in the first added rows.
+    Typed columns, unique values and sort keys of encoded columns are computed once per category.
+    """
+    def __init__(self, columns, rows=None, dtypes=None, categorical=None, max_categories=1000):
+        self.columns = list(columns)
+        self.dtypes = dict(dtypes or {})
+        self.categorical = categorical
+        self.max_categories = max_categories
+        self._values = [self._new_column(col) for col in self.columns]
+        self.ids = []
+        self._next_id = 0
+        self._id_positions = None
+        self._row_hashes = None
+        self.version = 0  # Incremented on every change of the rows
+        self._reset_cache()
+        if rows is not None:
+            self.add_rows(rows)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _reset_cache(self):
+        self.version += 1
+        self._key_positions = {}
+        self._typed_columns = {}
+        self._id_array = None
+
+    def _new_column(self, col):
+        if self.categorical != 'auto' and col in (self.categorical or []):
+            return CategoricalColumn()
+        return []
+
+    def _encode_columns(self, columns):
+        """
+        Chooses the columns to encode from the first added rows when categorical is 'auto'.
+        """
+        for k, new_values in enumerate(columns):
+            if isinstance(self._values[k], CategoricalColumn) or not all(isinstance(value, str) for value in new_values):
+                continue
+            if len(set(new_values)) <= min(self.max_categories, len(new_values) // 2):
+                self._values[k] = CategoricalColumn()
+
+    def is_categorical(self, col):
+        return isinstance(self._values[self.column_index(col)], CategoricalColumn)
+
+    def clear(self):
+        self._values = [self._new_column(col) for col in self.columns]
+        self.ids = []
+        self._id_positions = None
+        self._row_hashes = None
+        self._reset_cache()
+
+    def add_rows(self, rows):
+        """
+        Adds rows to the end of the store.
+        :param rows: iterable of sequences with one value per column. Short rows are padded, see pad_row.
+        :return: range with the indices of the added rows
+        """
+        rows = list(rows)
+        if not rows:
+            return range(len(self), len(self))
+        nr_columns = len(self.columns)
+        if any(len(row) != nr_columns for row in rows):
+            rows = [self.pad_row(row) for row in rows]
+        return self.add_columns(list(zip(*rows)))
+
+    def pad_row(self, row):
+        """
+        Returns row as a tuple with one value per column. Missing values at the end are set to '' and extra values
+        are dropped.
+        :param row:
+        :return:
+        """
+        row = tuple(row)
+        nr_columns = len(self.columns)
+        return row[:nr_columns] + ('',) * (nr_columns - len(row))
+
+    def add_columns(self, columns):
+        """
+        Adds rows given column wise to the end of the store.
+        :param columns: one sequence of values per column, all of the same length
+        :return: range with the indices of the added rows
+        """
+        start = len(self)
+        if not start and self.categorical == 'auto':
+            columns = [list(values) for values in columns]
+            self._encode_columns(columns)
+        for values, new_values in zip(self._values, columns):
+            values.extend(new_values)
+        nr_rows = len(self._values[0]) - start if self._values else 0
+        new_ids = range(self._next_id, self._next_id + nr_rows)
+        self.ids.extend(new_ids)
+        self._next_id += nr_rows
+        if self._id_positions is not None:
+            self._id_positions.update(zip(new_ids, range(start, start + nr_rows)))
+        if self._row_hashes is not None:
+            self._row_hashes.extend(_hash_row(self.get_row(index)) for index in range(start, start + nr_rows))
+        self._reset_cache()
+        return range(start, start + nr_rows)
+
+    def update_row(self, index, row):
+        row = self.pad_row(row)
+        for values, value in zip(self._values, row):
+            values[index] = value
+        if self._row_hashes is not None:
+            self._row_hashes[index] = _hash_row(row)
+        self._reset_cache()
+
+    def delete_rows(self, indices):
+        """
+        Deletes the rows at the given indices. The order of the remaining rows is kept.
+        :param indices:
+        :return: array mapping old index to new index. Deleted rows are mapped to -1.
+        """
+        keep = np.ones(len(self), dtype=bool)
+        keep[np.asarray(list(indices), dtype=int)] = False
+        self._values = [values.compress(keep) if isinstance(values, CategoricalColumn)
+                        else list(itertools.compress(values, keep)) for values in self._values]
+        self.ids = list(itertools.compress(self.ids, keep))
+        if self._row_hashes is not None:
+            self._row_hashes = list(itertools.compress(self._row_hashes, keep))
+        self._id_positions = None
+        self._reset_cache()
+        new_indices = np.cumsum(keep) - 1
+        new_indices[~keep] = -1
+        return new_indices
+
+    def get_row_hash(self, index):
+        if self._row_hashes is None:
+            self._row_hashes = [_hash_row(row) for row in zip(*self._values)]
+        return self._row_hashes[index]
+
+    def get_key_positions(self, col):
+        """
+        Returns a dict mapping the values in the key column col to row index. Cached until the rows are changed.
+        :param col:
+        :return:
+        """
+        if col not in self._key_positions:
+            values = self._values[self.column_index(col)]
+            self._key_positions[col] = {value: k for k, value in enumerate(values)}
+        return self._key_positions[col]
+
+    def get_iids(self, indices):
+        """
+        Returns the tree item ids for the rows at the given indices.
+        :param indices:
+        :return:
+        """
+        return [str(self.ids[index]) for index in indices]
+
+    def get_id_array(self):
+        """
+        Returns the row ids as a numpy array. Cached until the rows are changed.
+        :return:
+        """
+        if self._id_array is None:
+            self._id_array = np.array(self.ids, dtype=np.int64)
+        return self._id_array
+
+    def get_index(self, iid):
+        """
+        Returns the row index for the given tree item id.
+        :param iid:
+        :return:
+        """
+        if self._id_positions is None:
+            self._id_positions = {i: k for k, i in enumerate(self.ids)}
+        return self._id_positions[int(iid)]
+
+    def get_indices(self, iids):
+        """
+        Returns the row indices for the given tree item ids as a numpy array.
+        Ids are increasing with the row index so the lookup is a binary search in the id array.
+        :param iids:
+        :return:
+        """
+        ids = np.fromiter((int(iid) for iid in iids), dtype=np.int64)
+        return np.searchsorted(self.get_id_array(), ids)
+
+    def column_index(self, col):
+        return self.columns.index(col)
+
+    def get_value(self, index, col):
+        return self._values[self.column_index(col)][index]
+
+    def get_row(self, index):
+        return tuple(values[index] for values in self._values)
+
+    def get_row_dict(self, index):
+        return {col: values[index] for col, values in zip(self.columns, self._values)}
+
+    def get_column_values(self, col):
+        """
+        Returns the list (or CategoricalColumn) holding the values of the given column. It must not be modified.
+        Lists are replaced (not modified) when rows are deleted, so the list can be read from another thread
+        as a snapshot of the rows present when it was taken.
+        :param col:
+        :return:
+        """
+        return self._values[self.column_index(col)]
+
+    def get_column(self, col):
+        """
+        Returns the values in the given column as an object array.
+        :param col:
+        :return:
+        """
+        values = self._values[self.column_index(col)]
+        if isinstance(values, CategoricalColumn):
+            return values.get_category_array()[values.get_codes()]
+        return np.fromiter(values, dtype=object, count=len(values))
+
+    def get_typed_column(self, col, kind):
+        """
+        Returns the values in the given column converted to a typed array. The array is cached until the rows are changed.
+        :param col:
+        :param kind: 'str', 'int', 'float' or 'datetime'. Values that can not be converted to float are set to nan
+                     and values that can not be converted to datetime are set to NaT. Int columns that can not be
+                     converted are returned as float.
+        :return:
+        """
+        key = (col, kind)
+        if key not in self._typed_columns:
+            values = self._values[self.column_index(col)]
+            if isinstance(values, CategoricalColumn):
+                # Each category is converted once
+                self._typed_columns[key] = _to_typed_array(values.get_category_array(), kind)[values.get_codes()]
+            else:
+                self._typed_columns[key] = _to_typed_array(self.get_column(col), kind)
+        return self._typed_columns[key]
+
+    def get_unique(self, col):
+        """
+        Returns the unique strings in the given column and the inverse index (as from np.unique). Cached until
+        the rows are changed.
+        :param col:
+        :return:
+        """
+        key = (col, 'unique')
+        if key not in self._typed_columns:
+            values = self._values[self.column_index(col)]
+            if isinstance(values, CategoricalColumn):
+                # Unique over the categories. Categories no longer used are kept in the unique values.
+                unique, inverse = np.unique(_to_typed_array(values.get_category_array(), 'str'), return_inverse=True)
+                self._typed_columns[key] = unique, inverse[values.get_codes()]
+            elif pd is not None and values and set(map(type, values)) == {str}:
+                # Factorized first so that only the distinct strings are sorted
+                codes, distinct = pd.factorize(np.array(values, dtype=object))
+                unique, inverse = np.unique(distinct.astype(str), return_inverse=True)
+                self._typed_columns[key] = unique, inverse[codes]
+            else:
+                self._typed_columns[key] = np.unique(self.get_typed_column(col, 'str'), return_inverse=True)
+        return self._typed_columns[key]
+
+    def get_column_hash(self, col):
+        """
+        Returns a hash of the values in the given column (None for unhashable values). Cached until the rows are changed.
+        :param col:
+        :return:
+        """
+        key = (col, 'hash')
+        if key not in self._typed_columns:
+            values = self._values[self.column_index(col)]
+            try:
+                if isinstance(values, CategoricalColumn):
+                    self._typed_columns[key] = hash((_hash_values(values.categories),
+                                                     hash(values.get_codes().tobytes())))
+                else:
+                    self._typed_columns[key] = _hash_values(values)
+            except TypeError:
+                # Unhashable values
+                self._typed_columns[key] = None
+        return self._typed_columns[key]
+
+    def get_dtype(self, col):
+        return self.dtypes.get(col, 'str')
+
+    def get_sort_keys(self, col):
+        """
+        Returns a numeric array to sort the given column on, built from the dtype of the column:
+            'int', 'float': the values
+            'datetime': the values as datetime64[us] viewed as int64
+            'natural': rank in natural string order ("st2" < "st10")
+            'str': rank in string order
+        The array is cached until the rows are changed.
+        :param col:
+        :return:
+        """
+        dtype = self.get_dtype(col)
+        key = (col, 'sort')
+        if key not in self._typed_columns:
+            if dtype in ('int', 'float'):
+                keys = self.get_typed_column(col, dtype)
+            elif dtype == 'datetime':
+                keys = self.get_typed_column(col, 'datetime').view(np.int64)
+            elif dtype == 'natural':
+                unique, inverse = self.get_unique(col)
+                unique_keys = natural_keys(unique.tolist())
+                order = sorted(range(len(unique)), key=unique_keys.__getitem__)
+                rank = np.empty(len(unique), dtype=np.int64)
+                rank[order] = np.arange(len(unique))
+                keys = rank[inverse]
+            else:
+                keys = self.get_unique(col)[1].astype(np.int64)
+            self._typed_columns[key] = keys
+        return self._typed_columns[key]
+
+    def argsort(self, sort_columns):
+        """
+        Returns the (stable) permutation of row indices that sorts the rows on several columns.
+        Missing values (nan and NaT) are placed last in both directions.
+        :param sort_columns: list of (col, descending). The first column is the primary sort key.
+        :return:
+        """
+        keys = []
+        for col, descending in reversed(sort_columns):
+            col_keys = self.get_sort_keys(col)
+            if col_keys.dtype.kind == 'f':
+                missing = np.isnan(col_keys)
+            elif self.get_dtype(col) == 'datetime':
+                missing = col_keys == np.iinfo(np.int64).min
+            else:
+                missing = None
+            if missing is not None and missing.any():
+                col_keys = np.where(missing, 0, col_keys)
+            else:
+                missing = None
+            if descending:
+                # ~ reverses the order of integers without overflow
+                col_keys = -col_keys if col_keys.dtype.kind == 'f' else ~col_keys
+            keys.append(col_keys)
+            if missing is not None:
+                keys.append(missing)
+        if not keys:
+            return np.arange(len(self))
+        return _lexsort(keys)
+
+
+class CategoricalColumn(object):
+    """
+    Dictionary encoded column: the values are stored as int32 codes into a list of categories (the distinct values).
+    Used by TableData in place of a list. Indexing and iteration return the decoded values.
+    Categories are only added, so a column can be read as a snapshot (see TableData.get_column_values) also after
+    new values have been added.
+    """
+    def __init__(self, values=(), categories=None, codes=None):
+        self.categories = [] if categories is None else categories
+        self._code_map = _CategoryCodes(self.categories)
+        self._codes = array.array('i')
+        if codes is not None:
+            self._codes = codes
+        self.extend(values)
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.categories[code] for code in self._codes[index]]
+        return self.categories[self._codes[index]]
+
+    def __setitem__(self, index, value):
+        self._codes[index] = self._code_map[value]
+
+    def __iter__(self):
+        return map(self.categories.__getitem__, self._codes)
+
+    def extend(self, values):
+        self._codes.extend(map(self._code_map.__getitem__, values))
+
+    def compress(self, keep):
+        """
+        Returns a new column with the values where keep is True. The categories are shared.
+        :param keep: boolean sequence
+        :return:
+        """
+        column = CategoricalColumn(categories=self.categories, codes=array.array('i', itertools.compress(self._codes, keep)))
+        column._code_map = self._code_map
+        return column
+
+    def get_codes(self):
+        """
+        Returns a copy of the codes as an int32 array.
+        """
+        return np.array(self._codes, dtype=np.int32)
+
+    def get_category_array(self):
+        categories = np.empty(len(self.categories), dtype=object)
+        categories[:] = self.categories
+        return categories
+
+
+class _CategoryCodes(dict):
+    """
+    Maps a value to its code. Unknown values are added to the categories.
+    """
+    def __init__(self, categories):
+        dict.__init__(self, ((value, code) for code, value in enumerate(categories)))
+        self.categories = categories
+
+    def __missing__(self, value):
+        code = self[value] = len(self.categories)
+        self.categories.append(value)
+        return code
+
+
+class ColumnAggregate(object):
+    """
+    Count, min, max, mean and distinct count of the values in a column, updated incrementally when values are
+    added or removed. Empty values (None, '' and nan) are not counted. Values are distinct by their string.
+    min, max and mean are taken from the numeric values. If there are no numeric values min and max are taken from
+    the values as strings. min and max are recomputed from the distinct values only when a removed value was the
+    min or max.
+    Use from_column to compute the aggregate of a TableData column vectorized.
+    """
+    EMPTY_STRINGS = ['', 'None', 'nan']
+
+    def __init__(self):
+        self.count = 0
+        self._distinct = collections.Counter()
+        # Sorted distinct strings and their counts set by from_column. Converted to self._distinct when values are
+        # added or removed.
+        self._unique = None
+        self._counts = None
+        self._numeric_count = 0
+        self._sum = 0.
+        self._min = np.inf
+        self._max = -np.inf
+        self._minmax_valid = True
+
+    @classmethod
+    def from_column(cls, data, col, mask=None):
+        """
+        Returns the aggregate of a column in data, computed from the cached unique values and float array of the column.
+        :param data: TableData
+        :param col:
+        :param mask: boolean array with True for the rows to include, all rows if None
+        :return:
+        """
+        aggregate = cls()
+        unique, inverse = data.get_unique(col)
+        floats = data.get_typed_column(col, 'float')
+        if mask is not None:
+            inverse = inverse[mask]
+            floats = floats[mask]
+        counts = np.bincount(inverse, minlength=len(unique))
+        counts[np.isin(unique, cls.EMPTY_STRINGS)] = 0
+        used = counts > 0
+        aggregate._unique = unique[used]
+        aggregate._counts = counts[used]
+        aggregate.count = int(aggregate._counts.sum())
+        aggregate._add_numeric(floats)
+        return aggregate
+
+    def _prepare(self, values, floats=None):
+        values = np.fromiter(values, dtype=object, count=len(values))
+        if floats is None:
+            floats = _to_float_array(values)
+        strings = values.astype(str)
+        empty = np.isin(strings, self.EMPTY_STRINGS)
+        return strings[~empty].tolist(), floats[~empty]
+
+    def _get_distinct(self):
+        if self._unique is not None:
+            self._distinct = collections.Counter(dict(zip(self._unique.tolist(), self._counts.tolist())))
+            self._unique = None
+            self._counts = None
+        return self._distinct
+
+    def _add_numeric(self, floats):
+        numeric = floats[~np.isnan(floats)]
+        if not len(numeric):
+            return
+        self._numeric_count += len(numeric)
+        self._sum += numeric.sum()
+        if self._minmax_valid:
+            self._min = min(self._min, numeric.min())
+            self._max = max(self._max, numeric.max())
+
+    def add(self, values, floats=None):
+        """
+        :param values: sequence of values
+        :param floats: the values as float array (nan where not numeric) if already available
+        :return:
+        """
+        values, floats = self._prepare(values, floats)
+        self.count += len(values)
+        self._get_distinct().update(values)
+        self._add_numeric(floats)
+
+    def remove(self, values, floats=None):
+        values, floats = self._prepare(values, floats)
+        self.count -= len(values)
+        distinct = self._get_distinct()
+        distinct.subtract(values)
+        for value in set(values):
+            if distinct[value] <= 0:
+                del distinct[value]
+        numeric = floats[~np.isnan(floats)]
+        if not len(numeric):
+            return
+        self._numeric_count -= len(numeric)
+        self._sum -= numeric.sum()
+        if numeric.min() <= self._min or numeric.max() >= self._max:
+            self._minmax_valid = False
+
+    def get_stats(self):
+        """
+        :return: dict with count, min, max, mean and distinct. min, max and mean are None if not available.
+        """
+        distinct = self._distinct if self._unique is None else self._unique
+        stats = {'count': self.count, 'min': None, 'max': None, 'mean': None, 'distinct': len(distinct)}
+        if self._numeric_count:
+            if not self._minmax_valid:
+                floats = _to_float_array(np.fromiter(distinct, dtype=object, count=len(distinct)))
+                self._min = np.nanmin(floats)
+                self._max = np.nanmax(floats)
+                self._minmax_valid = True
+            stats['min'] = float(self._min)
+            stats['max'] = float(self._max)
+            stats['mean'] = float(self._sum / self._numeric_count)
+        elif self._unique is not None and len(self._unique):
+            # Sorted
+            stats['min'] = str(self._unique[0])
+            stats['max'] = str(self._unique[-1])
+        elif self._distinct:
+            stats['min'] = min(self._distinct)
+            stats['max'] = max(self._distinct)
+        return stats
+
+
+class SearchIndex(object):
+    """
+    Trigram index for case insensitive substring search over the stringified cells of a table.
+    Each distinct cell string is indexed once and maps to the ids of the rows that contain it.
+    Rows are added and removed incrementally.
+    """
+    def __init__(self):
+        self._row_ids = {}  # Cell string -> set of row ids
+        self._trigrams = {}  # Trigram -> set of cell strings
+
+    def add_rows(self, row_ids, rows):
+        """
+        :param row_ids: iterable of row ids
+        :param rows: iterable of rows (sequences of cell values)
+        :return:
+        """
+        for row_id, row in zip(row_ids, rows):
+            for value in row:
+                string = str(value).lower()
+                ids = self._row_ids.get(string)
+                if ids is None:
+                    ids = self._row_ids[string] = set()
+                    for trigram in _get_trigrams(string):
+                        self._trigrams.setdefault(trigram, set()).add(string)
+                ids.add(row_id)
+
+    def remove_rows(self, row_ids, rows):
+        for row_id, row in zip(row_ids, rows):
+            for value in row:
+                string = str(value).lower()
+                ids = self._row_ids.get(string)
+                if ids is None:
+                    continue
+                ids.discard(row_id)
+                if ids:
+                    continue
+                del self._row_ids[string]
+                for trigram in _get_trigrams(string):
+                    strings = self._trigrams[trigram]
+                    strings.discard(string)
+                    if not strings:
+                        del self._trigrams[trigram]
+
+    def search(self, text, prefix=False):
+        """
+        Returns the ids of the rows with a cell containing text (case insensitive).
+        :param text:
+        :param prefix: True to only match cells starting with text
+        :return: set of row ids
+        """
+        text = str(text).lower()
+        if not text:
+            return set()
+        trigrams = _get_trigrams(text)
+        if trigrams:
+            candidates = sorted((self._trigrams.get(trigram, set()) for trigram in trigrams), key=len)
+            candidates = candidates[0].intersection(*candidates[1:])
+        else:
+            candidates = self._row_ids
+        row_ids = set()
+        for string in candidates:
+            if string.startswith(text) if prefix else text in string:
+                row_ids.update(self._row_ids[string])
+        return row_ids
+
+
+def _get_trigrams(string):
+    return {string[i:i + 3] for i in range(len(string) - 2)}
+
+
+class ColumnFilter(object):
+    """
+    Filter on one column in a TableData. All given criteria must be fulfilled.
+    The filter is evaluated as a boolean mask over all rows in the store. Numeric criteria are compared with the
+    column converted to float, string criteria with the column converted to str. Substring and regex criteria are
+    evaluated once per unique value in the column. All criteria on a dictionary encoded column are evaluated once per
+    category and gathered by the codes.
+    """
+    def __init__(self,
+                 col,
+                 equals=None,
+                 min_value=None,
+                 max_value=None,
+                 contains=None,
+                 regex=None,
+                 isin=None,
+                 case_sensitive=True):
+        self.col = col
+        self.equals = equals
+        self.min_value = min_value
+        self.max_value = max_value
+        self.contains = contains
+        self.regex = regex
+        self.isin = isin
+        self.case_sensitive = case_sensitive
+
+    def __repr__(self):
+        criteria = ', '.join('{}={!r}'.format(key, value) for key, value in self.__dict__.items()
+                             if key != 'col' and value is not None)
+        return 'ColumnFilter({!r}, {})'.format(self.col, criteria)
+
+    def _get_values(self, data, value):
+        if _is_number(value):
+            return data.get_typed_column(self.col, 'float')
+        return data.get_typed_column(self.col, 'str')
+
+    def _get_unique_mask(self, data, match):
+        unique, inverse = data.get_unique(self.col)
+        return np.array([bool(match(value)) for value in unique], dtype=bool)[inverse]
+
+    def get_arrays(self, data):
+        """
+        Returns the arrays of data that the mask is computed from. Rows with equal arrays give the same mask.
+        :param data: TableData
+        :return: list of numpy arrays
+        """
+        kinds = set()
+        for value in (self.equals, self.min_value, self.max_value):
+            if value is not None:
+                kinds.add('float' if _is_number(value) else 'str')
+        if self.isin is not None:
+            values = list(self.isin)
+            kinds.add('float' if values and all(_is_number(value) for value in values) else 'str')
+        arrays = [data.get_typed_column(self.col, kind) for kind in sorted(kinds)]
+        if self.contains is not None or self.regex is not None:
+            arrays.extend(data.get_unique(self.col))
+        return arrays
+
+    def get_mask(self, data):
+        """
+        Returns a boolean array with True for the rows in data that pass the filter.
+        :param data: TableData
+        :return:
+        """
+        values = data.get_column_values(self.col)
+        if isinstance(values, CategoricalColumn):
+            # Evaluated once per category and gathered by the codes
+            categories = TableData([self.col], rows=[(value,) for value in values.categories],
+                                   dtypes={self.col: data.get_dtype(self.col)})
+            return self.get_mask(categories)[values.get_codes()]
+        mask = np.ones(len(data), dtype=bool)
+        if self.equals is not None:
+            mask &= self._get_values(data, self.equals) == (self.equals if _is_number(self.equals) else str(self.equals))
+        if self.min_value is not None:
+            mask &= self._get_values(data, self.min_value) >= self.min_value
+        if self.max_value is not None:
+            mask &= self._get_values(data, self.max_value) <= self.max_value
+        if self.isin is not None:
+            values = list(self.isin)
+            if values and all(_is_number(value) for value in values):
+                mask &= np.isin(data.get_typed_column(self.col, 'float'), values)
+            else:
+                mask &= np.isin(data.get_typed_column(self.col, 'str'), [str(value) for value in values])
+        if self.contains is not None:
+            sub = str(self.contains)
+            if self.case_sensitive:
+                mask &= self._get_unique_mask(data, lambda value: sub in value)
+            else:
+                sub = sub.lower()
+                mask &= self._get_unique_mask(data, lambda value: sub in value.lower())
+        if self.regex is not None:
+            pattern = re.compile(self.regex, 0 if self.case_sensitive else re.IGNORECASE)
+            mask &= self._get_unique_mask(data, pattern.search)
+        return mask
+
+
+def _lexsort(keys):
+    """
+    Stable sort on several keys, last key primary (as np.lexsort). Integer keys with a small enough combined range
+    are merged into one key, which is sorted faster.
+    """
+    if len(keys) > 1 and all(key.dtype.kind in 'biu' for key in keys):
+        keys = [key.astype(np.int64) for key in keys]
+        mins = [int(key.min()) for key in keys]
+        spans = [int(key.max()) - low + 1 for key, low in zip(keys, mins)]
+        total = 1
+        for span in spans:
+            total *= span
+        if total < 2 ** 62:
+            combined = np.zeros(len(keys[0]), dtype=np.int64)
+            multiplier = 1
+            for key, low, span in zip(keys, mins, spans):
+                combined += (key - low) * multiplier
+                multiplier *= span
+            return np.argsort(combined, kind='stable')
+    return np.lexsort(keys)
+
+
+def _is_number(value):
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, bool)
+
+
+def _to_datetime64(value):
+    try:
+        return np.datetime64(value, 'us')
+    except (TypeError, ValueError):
+        return np.datetime64('NaT', 'us')
+
+
+def _to_typed_array(values, kind):
+    """
+    Converts an object array to a typed array, see TableData.get_typed_column.
+    """
+    if kind == 'int':
+        try:
+            return values.astype(np.int64)
+        except (TypeError, ValueError, OverflowError):
+            return _to_float_array(values)
+    if kind == 'datetime':
+        try:
+            return values.astype('datetime64[us]')
+        except (TypeError, ValueError):
+            return np.array([_to_datetime64(value) for value in values], dtype='datetime64[us]')
+    if kind == 'float':
+        return _to_float_array(values)
+    return values.astype(str)
+
+
+def _hash_values(values):
+    """
+    Hash of a sequence of values. The types and the positions of -1 are included since values like 1 and 1.0 or
+    -1 and -2 have the same hash. NaN values are included by position since the hash of a NaN depends on the object.
+    """
+    nans = tuple(map(operator.ne, values, values))
+    if any(nans):
+        values = [None if is_nan else value for value, is_nan in zip(values, nans)]
+    return hash((len(values),
+                 hash(tuple(values)),
+                 hash(tuple(map(type, values))),
+                 hash(nans),
+                 hash(tuple(map(operator.eq, values, itertools.repeat(-1))))))
+
+
+def _to_float_array(values):
+    try:
+        return values.astype(float)
+    except (TypeError, ValueError):
+        return np.array([_to_float(value) for value in values], dtype=float)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def get_groups(data, columns, rows):
+    """
+    Groups rows on the values in columns (vectorized, no Python loop over the rows).
+    Groups are ordered on the sort keys of the columns (see TableData.get_sort_keys) and rows keep their order
+    within a group.
+    :param data: TableData
+    :param columns: columns to group on
+    :param rows: int array with row indices in data
+    :return: tuple (keys, starts, counts, ordered_rows). keys is a list with a tuple of column values for each group
+             and the rows in group k are ordered_rows[starts[k]:starts[k] + counts[k]]
+    """
+    rows = np.asarray(rows, dtype=int)
+    if not len(rows) or not columns:
+        return [], np.array([], dtype=int), np.array([], dtype=int), rows
+    group_codes = None
+    for col in columns:
+        unique, codes = np.unique(data.get_sort_keys(col)[rows], return_inverse=True)
+        if group_codes is None:
+            group_codes = codes
+        else:
+            # Re-rank after each column so that the combined codes stay small
+            group_codes = np.unique(group_codes * len(unique) + codes, return_inverse=True)[1]
+    counts = np.bincount(group_codes)
+    ordered_rows = rows[np.argsort(group_codes, kind='stable')]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    keys = [tuple(data.get_value(row, col) for col in columns) for row in ordered_rows[starts].tolist()]
+    return keys, starts, counts, ordered_rows
+
+
+def aggregate_groups(floats, starts, aggregate='mean'):
+    """
+    Aggregates consecutive groups of values. nan values are ignored.
+    :param floats: float array ordered by group
+    :param starts: start position of each group in floats
+    :param aggregate: 'mean', 'sum', 'min', 'max' or 'count'
+    :return: float array with one value per group. nan for groups without values.
+    """
+    valid = ~np.isnan(floats)
+    counts = np.add.reduceat(valid.astype(np.int64), starts)
+    if aggregate == 'count':
+        return counts.astype(float)
+    if aggregate in ('mean', 'sum'):
+        result = np.add.reduceat(np.where(valid, floats, 0.), starts)
+        if aggregate == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = result / counts
+    elif aggregate == 'min':
+        result = np.fmin.reduceat(floats, starts)
+    elif aggregate == 'max':
+        result = np.fmax.reduceat(floats, starts)
+    else:
+        raise ValueError('Unknown aggregate: {}'.format(aggregate))
+    result[counts == 0] = np.nan
+    return result
+
+
+def get_sample_indices(nr_rows, sample_size, nr_strata=8, rng=None):
+    """
+    Returns a stratified random sample of row positions. The rows are split in nr_strata equal parts and the same
+    number of positions is drawn from each part, so that the start, middle and end of the table are all covered.
+    :param nr_rows:
+    :param sample_size: approximate number of positions
+    :param nr_strata:
+    :param rng: numpy random Generator
+    :return: sorted int array without duplicates. All positions if nr_rows <= sample_size.
+    """
+    if nr_rows <= sample_size:
+        return np.arange(nr_rows)
+    rng = rng or np.random.default_rng()
+    nr_strata = max(1, min(nr_strata, sample_size))
+    bounds = np.linspace(0, nr_rows, nr_strata + 1)
+    nr_per_stratum = -(-sample_size // nr_strata)
+    starts = np.repeat(bounds[:-1], nr_per_stratum)
+    lengths = np.repeat(np.diff(bounds), nr_per_stratum)
+    return np.unique((starts + rng.random(len(starts)) * lengths).astype(int))
+
+
+def get_frame_columns(frame, columns):
+    """
+    Returns one numpy array per column in columns from a pandas DataFrame or a numpy structured array.
+    Datetime columns are returned with microsecond resolution so that tolist() gives datetime objects.
+    :param frame:
+    :param columns:
+    :return:
+    """
+    arrays = []
+    for col in columns:
+        values = frame[col]
+        if hasattr(values, 'to_numpy'):
+            values = values.to_numpy()
+        values = np.asarray(values)
+        if values.dtype.kind == 'M':
+            values = values.astype('datetime64[us]')
+        arrays.append(values)
+    return arrays
+
+
+def format_column(values, fmt=None):
+    """
+    Returns the values as an array of display strings.
+    :param values: numpy array
+    :param fmt: printf style format, ex. '%.2f', applied to finite numbers. If None values are converted with str.
+                Missing values (None, NaN and NaT) are shown as '', as in format_value.
+    :return:
+    """
+    kind = values.dtype.kind
+    if kind == 'M':
+        missing = np.isnat(values)
+        texts = np.char.replace(np.datetime_as_string(values, unit='s'), 'T', ' ')
+    elif kind in 'iuf':
+        missing = np.isnan(values) if kind == 'f' else np.zeros(len(values), dtype=bool)
+        if not fmt:
+            texts = values.astype(str)
+        else:
+            # The format is only applied to finite numbers
+            finite = ~missing & ~np.isinf(values) if kind == 'f' else ~missing
+            texts = values.astype(str).astype(object)
+            texts[finite] = np.char.mod(fmt, values[finite]).astype(object)
+            texts = texts.astype(str)
+    elif kind == 'O':
+        return np.array([str(format_value(value, fmt)) for value in values.tolist()], dtype=str)
+    else:
+        return values.astype(str)
+    if missing.any():
+        texts = texts.astype(object)
+        texts[missing] = ''
+        texts = texts.astype(str)
+    return texts
+
+
+def format_value(value, fmt=None):
+    """
+    Returns the value to show for value. Missing values (None, NaN and NaT) are shown as ''.
+    The printf style format fmt is only applied to finite numbers, other values are converted with str.
+    :param value:
+    :param fmt:
+    :return:
+    """
+    if _is_missing(value):
+        return ''
+    if fmt is None:
+        return value
+    if _is_number(value) and value not in (np.inf, -np.inf):
+        return fmt % value
+    return str(value)
+
+
+def _is_missing(value):
+    try:
+        return value is None or bool(value != value)
+    except (TypeError, ValueError):
+        return False
+
+
+def get_row_diff(data, key_col, rows):
+    """
+    Compares the rows in data with the new rows using the key column key_col.
+    Unchanged rows are detected with a hash comparison (and confirmed with an equality check). NaN values are
+    equal to each other.
+    :param data: TableData
+    :param key_col:
+    :param rows: iterable of sequences with one value per column
+    :return: tuple (deleted, changed, added) where deleted is a list of indices in data,
+             changed a list of (index, row) and added a list of rows
+    """
+    key_index = data.column_index(key_col)
+    positions = data.get_key_positions(key_col)
+    changed = []
+    added = []
+    found = set()
+    for row in rows:
+        row = data.pad_row(row)
+        index = positions.get(row[key_index])
+        if index is None:
+            added.append(row)
+            continue
+        found.add(index)
+        if _hash_row(row) != data.get_row_hash(index) or not rows_equal(row, data.get_row(index)):
+            changed.append((index, row))
+    deleted = [index for index in positions.values() if index not in found]
+    return deleted, changed, added
+
+
+_NAN = object()  # Replaces NaN values when hashing rows
+
+
+def _hash_row(row):
+    """
+    Hash of a row where all NaN values have the same hash.
+    """
+    if any(map(operator.ne, row, row)):
+        row = tuple(_NAN if value != value else value for value in row)
+    return hash(row)
+
+
+def values_equal(value, other):
+    """
+    Returns True if the values are equal or both are NaN.
+    """
+    return value == other or (value != value and other != other)
+
+
+def rows_equal(row, other):
+    return row == other or (len(row) == len(other) and all(map(values_equal, row, other)))
+
+
+def iter_column_chunks(values, indices, chunk_size=10000):
+    """
+    Yields the values for the given rows in chunks, column wise.
+    :param values: one list of values per column (see TableData.get_column_values)
+    :param indices: row indices to take, in order
+    :param chunk_size:
+    :return: generator of (nr_rows_done, list of one list per column)
+    """
+    for start in range(0, len(indices), chunk_size):
+        chunk = [int(index) for index in indices[start:start + chunk_size]]
+        yield start + len(chunk), [_take(column_values, chunk) for column_values in values]
+
+
+def _take(values, indices):
+    if len(indices) == 1:
+        return [values[indices[0]]]
+    return list(operator.itemgetter(*indices)(values))
+
+
+def export_csv(file_path, columns, values, indices, chunk_size=10000, callback_progress=None, stop_event=None, **kwargs):
+    """
+    Writes the given rows to a csv file chunk by chunk.
+    :param file_path:
+    :param columns: header
+    :param values: one list of values per column
+    :param indices: row indices to write, in order
+    :param chunk_size:
+    :param callback_progress: called with (nr_rows_written, nr_rows) after each chunk
+    :param stop_event: threading.Event. The export is stopped if set.
+    :param kwargs: passed to csv.writer, ex. delimiter='\t'
+    :return: False if stopped, else True
+    """
+    with open(file_path, 'w', newline='', encoding='utf-8') as fid:
+        writer = csv.writer(fid, **kwargs)
+        writer.writerow(columns)
+        for nr_rows, chunk in iter_column_chunks(values, indices, chunk_size=chunk_size):
+            if stop_event is not None and stop_event.is_set():
+                return False
+            writer.writerows(zip(*chunk))
+            if callback_progress:
+                callback_progress(nr_rows, len(indices))
+    return True
+
+
+def export_parquet(file_path, columns, values, indices, chunk_size=10000, callback_progress=None, stop_event=None):
+    """
+    Writes the given rows to a parquet file, one row group per chunk. Requires pyarrow.
+    The type of each column is decided from all its values before writing. Columns with types that can not be
+    combined are written as strings. The file is removed if the export fails or is stopped.
+    Arguments as for export_csv.
+    :return: False if stopped, else True
+    """
+    if pa is None:
+        raise ImportError('pyarrow is needed to export to parquet')
+    schema = pa.schema([(col, _get_arrow_type(column_values)) for col, column_values in zip(columns, values)])
+    writer = pq.ParquetWriter(file_path, schema)
+    completed = False
+    try:
+        for nr_rows, chunk in iter_column_chunks(values, indices, chunk_size=chunk_size):
+            if stop_event is not None and stop_event.is_set():
+                return False
+            table = pa.Table.from_arrays([_to_arrow(column_values, field.type)
+                                          for column_values, field in zip(chunk, schema)], schema=schema)
+            writer.write_table(table)
+            if callback_progress:
+                callback_progress(nr_rows, len(indices))
+        completed = True
+    finally:
+        writer.close()
+        if not completed:
+            os.remove(file_path)
+    return True
+
+
+def _get_arrow_type(values):
+    """
+    Returns the arrow type for a column, inferred from one value of each Python type in the column.
+    String if the types can not be combined or the column only holds None.
+    """
+    samples = dict(zip(map(type, values), values))
+    try:
+        arrow_type = pa.array(list(samples.values())).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        return pa.string()
+    if pa.types.is_null(arrow_type):
+        return pa.string()
+    return arrow_type
+
+
+def _to_arrow(values, arrow_type):
+    if pa.types.is_string(arrow_type):
+        return pa.array([None if value is None else str(value) for value in values], type=arrow_type)
+    return pa.array(values, type=arrow_type)
@@ -0,0 +1,491 @@
+# Copyright (c) 2018 SMHI, Swedish Meteorological and Hydrological Institute
+# License: MIT License (see LICENSE.txt or http://opensource.org/licenses/mit).
+
+import collections
+import os
+import re
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None
+
+from .table_data import TableData, _hash_row, _hash_values
+
+
+class SqliteTableSource(object):
+    """
+    Read only data source for a TableWidget (virtual mode) that pages rows from a table or view in an sqlite3 database.
+    Only the pages needed for the visible rows are fetched (LIMIT/OFFSET) and kept in a small LRU cache.
+    Sorting is done with ORDER BY and filters (ColumnFilter) are translated to a WHERE clause, so sorting and
+    filtering are fast on indexed columns.
+    Rows are identified by key_column which must be unique (rowid for ordinary tables).
+    """
+    def __init__(self,
+                 connection,
+                 table,
+                 columns=None,
+                 key_column='rowid',
+                 page_size=200,
+                 cache_size=16):
+        self.connection = connection
+        self.table = table
+        self.key_column = key_column
+        self.page_size = page_size
+        self.cache_size = cache_size
+
+        self.columns = list(columns or self._get_table_columns())
+        self._order_by = ''
+        self._where = ''
+        self._params = []
+        self._count = None
+        self._pages = collections.OrderedDict()
+
+        self.connection.create_function('REGEXP', 2, _regexp, deterministic=True)
+
+    def __len__(self):
+        if self._count is None:
+            sql = 'SELECT COUNT(*) FROM {}{}'.format(_quote(self.table), self._where)
+            self._count = self.connection.execute(sql, self._params).fetchone()[0]
+        return self._count
+
+    def _get_table_columns(self):
+        cursor = self.connection.execute('PRAGMA table_info({})'.format(_quote(self.table)))
+        return [row[1] for row in cursor.fetchall()]
+
+    def _clear_cache(self):
+        self._count = None
+        self._pages = collections.OrderedDict()
+
+    def _get_select(self):
+        return 'SELECT {}, {} FROM {}'.format(_quote(self.key_column),
+                                              ', '.join(_quote(col) for col in self.columns),
+                                              _quote(self.table))
+
+    def set_columns(self, columns):
+        """
+        Sets the columns (and their order) returned by the source.
+        :param columns:
+        :return:
+        """
+        self.columns = list(columns)
+        self._clear_cache()
+
+    def set_sort(self, sort_columns):
+        """
+        :param sort_columns: list of (col, descending). The first column is the primary sort key.
+        :return:
+        """
+        order = ['{} {}'.format(_quote(col), 'DESC' if descending else 'ASC') for col, descending in sort_columns]
+        # The key makes the order stable
+        order.append(_quote(self.key_column))
+        self._order_by = ' ORDER BY ' + ', '.join(order)
+        self._clear_cache()
+
+    def set_filters(self, filters, filter_mode='and'):
+        """
+        :param filters: list of ColumnFilter
+        :param filter_mode: 'and' or 'or'
+        :return:
+        """
+        clauses = []
+        params = []
+        for column_filter in filters:
+            clause, filter_params = _get_filter_clause(column_filter)
+            if clause:
+                clauses.append(clause)
+                params.extend(filter_params)
+        self._where = ''
+        if clauses:
+            self._where = ' WHERE ' + ' {} '.format('OR' if filter_mode == 'or' else 'AND').join(clauses)
+        self._params = params
+        self._clear_cache()
+
+    def _get_page(self, page_nr):
+        if page_nr in self._pages:
+            self._pages.move_to_end(page_nr)
+            return self._pages[page_nr]
+        sql = '{}{}{} LIMIT ? OFFSET ?'.format(self._get_select(), self._where, self._order_by)
+        page = self.connection.execute(sql, self._params + [self.page_size, page_nr * self.page_size]).fetchall()
+        self._pages[page_nr] = page
+        while len(self._pages) > self.cache_size:
+            self._pages.popitem(last=False)
+        return page
+
+    def get_rows(self, start, stop):
+        """
+        Returns the rows at positions start to stop (as shown in the table, after sorting and filtering).
+        :param start:
+        :param stop:
+        :return: tuple (row_ids, rows)
+        """
+        stop = min(stop, len(self))
+        row_ids = []
+        rows = []
+        for page_nr in range(start // self.page_size, (stop - 1) // self.page_size + 1):
+            page_start = page_nr * self.page_size
+            for row in self._get_page(page_nr)[max(0, start - page_start):stop - page_start]:
+                row_ids.append(row[0])
+                rows.append(tuple(row[1:]))
+        return row_ids, rows
+
+    def get_row_ids(self, start, stop):
+        """
+        Returns the row ids at positions start to stop. Only the key column is read.
+        :param start:
+        :param stop:
+        :return:
+        """
+        sql = 'SELECT {} FROM {}{}{} LIMIT ? OFFSET ?'.format(_quote(self.key_column), _quote(self.table),
+                                                              self._where, self._order_by)
+        cursor = self.connection.execute(sql, self._params + [max(0, stop - start), start])
+        return [row[0] for row in cursor]
+
+    def get_row_dict(self, row_id):
+        sql = 'SELECT {} FROM {} WHERE {} = ?'.format(', '.join(_quote(col) for col in self.columns),
+                                                      _quote(self.table), _quote(self.key_column))
+        row = self.connection.execute(sql, [row_id]).fetchone()
+        if row is None:
+            return {}
+        return dict(zip(self.columns, row))
+
+    def iter_rows(self):
+        """
+        Yields all rows passing the filters in sorted order.
+        :return:
+        """
+        sql = '{}{}{}'.format(self._get_select(), self._where, self._order_by)
+        for row in self.connection.execute(sql, self._params):
+            yield tuple(row[1:])
+
+    def get_aggregates(self):
+        """
+        Returns count, min, max, mean and distinct count for each column for the rows passing the filters.
+        mean is computed over numeric values only.
+        :return: dict with one dict per column
+        """
+        parts = []
+        for col in self.columns:
+            quoted = _quote(col)
+            parts.extend(['COUNT({})'.format(quoted),
+                          'MIN({})'.format(quoted),
+                          'MAX({})'.format(quoted),
+                          "AVG(CASE WHEN typeof({0}) IN ('integer', 'real') THEN {0} END)".format(quoted),
+                          'COUNT(DISTINCT {})'.format(quoted)])
+        sql = 'SELECT {} FROM {}{}'.format(', '.join(parts), _quote(self.table), self._where)
+        values = self.connection.execute(sql, self._params).fetchone()
+        stats = {}
+        for k, col in enumerate(self.columns):
+            stats[col] = dict(zip(['count', 'min', 'max', 'mean', 'distinct'], values[k * 5:k * 5 + 5]))
+        return stats
+
+
+class MappedTableData(TableData):
+    """
+    Read only TableData over memory mapped column arrays (numpy arrays or pyarrow ChunkedArrays).
+    Nothing is read until it is needed: take reads single rows and typed columns, sort keys and filter masks
+    (computed with the TableData methods) read whole columns once and are cached.
+    The id of a row is its index in the file. Methods that change the rows raise ValueError.
+    """
+    def __init__(self, arrays, dtypes=None):
+        TableData.__init__(self, list(arrays), dtypes=dtypes)
+        self._arrays = dict(arrays)
+        self.ids = range(len(next(iter(self._arrays.values()))) if self._arrays else 0)
+
+    def _read_only(self, *args, **kwargs):
+        raise ValueError('MappedTableData is read only')
+
+    clear = add_rows = add_columns = update_row = delete_rows = _read_only
+
+    def get_value(self, index, col):
+        return self.take(col, [index])[0]
+
+    def get_row(self, index):
+        return tuple(self.take(col, [index])[0] for col in self.columns)
+
+    def get_row_dict(self, index):
+        return dict(zip(self.columns, self.get_row(index)))
+
+    def get_row_hash(self, index):
+        return _hash_row(self.get_row(index))
+
+    def get_column_values(self, col):
+        return self.get_column(col)
+
+    def get_key_positions(self, col):
+        if col not in self._key_positions:
+            self._key_positions[col] = {value: k for k, value in enumerate(self.get_column(col).tolist())}
+        return self._key_positions[col]
+
+    def get_column_hash(self, col):
+        key = (col, 'hash')
+        if key not in self._typed_columns:
+            values = self.get_column(col)
+            if values.dtype.kind in 'biufM':
+                self._typed_columns[key] = hash((str(values.dtype), np.ascontiguousarray(values).tobytes()))
+            else:
+                try:
+                    self._typed_columns[key] = _hash_values(values.tolist())
+                except TypeError:
+                    self._typed_columns[key] = None
+        return self._typed_columns[key]
+
+    def get_column(self, col):
+        values = self._arrays[col]
+        if pa is not None and isinstance(values, pa.ChunkedArray):
+            return values.to_numpy()
+        return np.asarray(values)
+
+    def get_kind(self, col):
+        return _get_kind(self._arrays[col])
+
+    def take(self, col, indices):
+        """
+        Returns the values at the given row indices as a list, read directly from the mapped buffers.
+        :param col:
+        :param indices: int array
+        :return:
+        """
+        values = self._arrays[col]
+        if pa is not None and isinstance(values, pa.ChunkedArray):
+            return values.take(pa.array(indices, type=pa.int64())).to_pylist()
+        values = values[indices]
+        if values.dtype.kind == 'M':
+            values = values.astype('datetime64[us]')
+        return values.tolist()
+
+
+class MemmapTableSource(object):
+    """
+    Read only data source for a TableWidget (virtual mode) backed by a memory mapped file:
+        .npy: structured array (one column per field) or 2D array (columns named '0', '1', ...)
+        .arrow, .feather, .ipc: Arrow IPC file (requires pyarrow)
+    Opening the file does not read any data and only the visible rows are read from the mapped buffers.
+    Sorting and filtering read the involved columns (cached) and keep an index array of the rows shown.
+    Rows are identified by their index in the file.
+    dtypes is a dict with the sort type of columns as for TableData. Numeric columns are sorted as numbers.
+    """
+    def __init__(self, file_path, columns=None, dtypes=None):
+        self.file_path = file_path
+        arrays = _open_mapped_columns(file_path)
+        self.dtypes = {col: 'float' for col, values in arrays.items() if _get_kind(values) == 'numeric'}
+        self.dtypes.update(dtypes or {})
+        self._data = MappedTableData(arrays, dtypes=self.dtypes)
+        self.columns = list(columns or self._data.columns)
+
+        self._sort_columns = []
+        self._order = None  # Row indices in sorted order, None for file order
+        self._mask = None
+        self._view = None  # Row indices shown, None if all rows in file order
+        self._aggregates = None
+
+    def __len__(self):
+        if self._view is None:
+            return len(self._data)
+        return len(self._view)
+
+    def set_columns(self, columns):
+        for col in columns:
+            if col not in self._data.columns:
+                raise KeyError('Column {} not in {}'.format(col, self.file_path))
+        self.columns = list(columns)
+        self._aggregates = None
+
+    def set_sort(self, sort_columns):
+        """
+        :param sort_columns: list of (col, descending). The first column is the primary sort key.
+        :return:
+        """
+        self._sort_columns = list(sort_columns)
+        self._order = self._data.argsort(self._sort_columns) if self._sort_columns else None
+        self._update_view()
+
+    def set_filters(self, filters, filter_mode='and'):
+        """
+        :param filters: list of ColumnFilter
+        :param filter_mode: 'and' or 'or'
+        :return:
+        """
+        if not filters:
+            self._mask = None
+        else:
+            masks = [column_filter.get_mask(self._data) for column_filter in filters]
+            if filter_mode == 'or':
+                self._mask = np.logical_or.reduce(masks)
+            else:
+                self._mask = np.logical_and.reduce(masks)
+        self._aggregates = None
+        self._update_view()
+
+    def _update_view(self):
+        if self._mask is None:
+            self._view = self._order
+        elif self._order is None:
+            self._view = np.flatnonzero(self._mask)
+        else:
+            self._view = self._order[self._mask[self._order]]
+
+    def _get_indices(self, start, stop):
+        if self._view is None:
+            return np.arange(start, min(stop, len(self._data)))
+        return self._view[start:stop]
+
+    def get_rows(self, start, stop):
+        """
+        Returns the rows at positions start to stop (as shown in the table, after sorting and filtering).
+        :param start:
+        :param stop:
+        :return: tuple (row_ids, rows)
+        """
+        indices = self._get_indices(start, stop)
+        columns = [self._data.take(col, indices) for col in self.columns]
+        return indices.tolist(), list(zip(*columns))
+
+    def get_row_ids(self, start, stop):
+        return self._get_indices(start, stop)
+
+    def get_row_dict(self, row_id):
+        indices = np.array([row_id])
+        return {col: self._data.take(col, indices)[0] for col in self.columns}
+
+    def iter_rows(self, chunk_size=10000):
+        """
+        Yields all rows passing the filters in sorted order. Rows are read in chunks.
+        :return:
+        """
+        for start in range(0, len(self), chunk_size):
+            for row in self.get_rows(start, start + chunk_size)[1]:
+                yield row
+
+    def get_aggregates(self):
+        """
+        Returns count, min, max, mean and distinct count for each column for the rows passing the filters.
+        Empty values are not counted. Computed vectorized over whole columns and cached until the filters change.
+        :return: dict with one dict per column
+        """
+        if self._aggregates is None:
+            self._aggregates = {}
+        for col in self.columns:
+            if col not in self._aggregates:
+                self._aggregates[col] = self._get_column_stats(col)
+        return {col: self._aggregates[col] for col in self.columns}
+
+    def _get_column_stats(self, col):
+        kind = self._data.get_kind(col)
+        if kind == 'numeric':
+            values = self._data.get_typed_column(col, 'float')
+        elif kind == 'datetime':
+            values = self._data.get_typed_column(col, 'datetime')
+        else:
+            values = self._data.get_typed_column(col, 'str')
+        if self._mask is not None:
+            values = values[self._mask]
+        if kind == 'str':
+            values = values[~np.isin(values, ['', 'None', 'nan'])]
+        else:
+            values = values[~np.isnan(values)]
+        unique = np.unique(values)
+        stats = {'count': int(len(values)), 'min': None, 'max': None, 'mean': None, 'distinct': int(len(unique))}
+        if not len(unique):
+            return stats
+        if kind == 'numeric':
+            stats['min'] = float(unique[0])
+            stats['max'] = float(unique[-1])
+            stats['mean'] = float(values.mean())
+        else:
+            stats['min'] = str(unique[0].tolist())
+            stats['max'] = str(unique[-1].tolist())
+        return stats
+
+
+def _open_mapped_columns(file_path):
+    """
+    Memory maps a .npy or Arrow IPC file and returns a dict with the (unread) column arrays.
+    :param file_path:
+    :return:
+    """
+    if os.path.splitext(file_path)[1].lower() == '.npy':
+        array = np.load(file_path, mmap_mode='r')
+        if array.dtype.names:
+            return {name: array[name] for name in array.dtype.names}
+        if array.ndim == 2:
+            return {str(k): array[:, k] for k in range(array.shape[1])}
+        raise ValueError('{} must hold a structured or 2D array'.format(file_path))
+    if pa is None:
+        raise ImportError('pyarrow is needed to read Arrow files')
+    table = pa.ipc.open_file(pa.memory_map(file_path, 'r')).read_all()
+    return {name: table.column(name) for name in table.column_names}
+
+
+def _get_kind(values):
+    """
+    Returns 'numeric', 'datetime' or 'str' from the type of a mapped column.
+    """
+    if pa is not None and isinstance(values, pa.ChunkedArray):
+        if pa.types.is_integer(values.type) or pa.types.is_floating(values.type):
+            return 'numeric'
+        if pa.types.is_timestamp(values.type) or pa.types.is_date(values.type):
+            return 'datetime'
+        return 'str'
+    if values.dtype.kind in 'iuf':
+        return 'numeric'
+    if values.dtype.kind == 'M':
+        return 'datetime'
+    return 'str'
+
+
+def _quote(name):
+    return '"{}"'.format(str(name).replace('"', '""'))
+
+
+def _regexp(pattern, value):
+    if value is None:
+        return False
+    return re.search(pattern, str(value)) is not None
+
+
+def _get_filter_clause(column_filter):
+    """
+    Translates a ColumnFilter to an sql expression.
+    :param column_filter:
+    :return: tuple (clause, params)
+    """
+    col = _quote(column_filter.col)
+    clauses = []
+    params = []
+    if column_filter.equals is not None:
+        clauses.append('{} = ?'.format(col))
+        params.append(column_filter.equals)
+    if column_filter.min_value is not None:
+        clauses.append('{} >= ?'.format(col))
+        params.append(column_filter.min_value)
+    if column_filter.max_value is not None:
+        clauses.append('{} <= ?'.format(col))
+        params.append(column_filter.max_value)
+    if column_filter.isin is not None:
+        values = list(column_filter.isin)
+        if values:
+            clauses.append('{} IN ({})'.format(col, ', '.join('?' * len(values))))
+            params.extend(values)
+        else:
+            clauses.append('0')
+    if column_filter.contains is not None:
+        if column_filter.case_sensitive:
+            clauses.append('instr({}, ?) > 0'.format(col))
+            params.append(str(column_filter.contains))
+        else:
+            escaped = re.sub(r'([\\%_])', r'\\\1', str(column_filter.contains))
+            clauses.append("{} LIKE ? ESCAPE '\\'".format(col))
+            params.append('%{}%'.format(escaped))
+    if column_filter.regex is not None:
+        pattern = column_filter.regex
+        if not column_filter.case_sensitive:
+            pattern = '(?i)' + pattern
+        clauses.append('{} REGEXP ?'.format(col))
+        params.append(pattern)
+    if not clauses:
+        return '', []
+    return '(' + ' AND '.join(clauses) + ')', params
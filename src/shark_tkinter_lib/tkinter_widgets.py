@@ -2,15 +2,27 @@
 # License: MIT License (see LICENSE.txt or http://opensource.org/licenses/mit).
 
 import calendar
+import collections
+import concurrent.futures
 import datetime
+import heapq
+import itertools
 import logging
+import os
+import queue
 import re
+import threading
 import tkinter as tk
 from tkinter import font
 from tkinter import ttk
 
 import numpy as np
 
+from .table_data import ColumnAggregate, ColumnFilter, SearchIndex, TableData, export_csv, export_parquet, format_column, format_value, \
+    get_frame_columns, get_row_diff, get_sample_indices, \
+    get_groups, aggregate_groups, values_equal
+from .sort_keys import natural_key, sorted_int
+
 try:
     import pandas as pd
 except:
@@ -1578,10 +1590,7 @@ class ListboxWidget(tk.Frame):
             self.items = list(set(self.items))
         # Add new entries
         if self.sort_items:
-            try:
-                self.items = sorted(self.items, key=int)
-            except:
-                self.items = sorted(self.items)
+            self.items = sorted_int(self.items)
             
 #        if self.include_blank_item: 
 #            if u'<blank>' in self.items:
@@ -2190,10 +2199,7 @@ class ListboxSelectionWidget(tk.Frame):
             self.items = list(set(self.items))
         # Add new entries
         if self.sort_items:
-            try:
-                self.items = sorted(self.items, key=int)
-            except:
-                self.items = sorted(self.items)
+            self.items = sorted_int(self.items)
         # try:
         #     self.items = sorted(self.items, key=int)
         # except:
@@ -2215,10 +2221,7 @@ class ListboxSelectionWidget(tk.Frame):
             self.selected_items = list(set(self.selected_items))
         # Add new entries
         if self.sort_items:
-            try:
-                self.selected_items = sorted(self.selected_items, key=int)
-            except:
-                self.selected_items = sorted(self.selected_items)
+            self.selected_items = sorted_int(self.selected_items)
         # if self.sort_selected:
         #     try:
         #         self.selected_items = sorted(self.selected_items, key=int)
@@ -4232,12 +4235,119 @@ class WrappedLabel(tk.Label):
         self.config(wraplength=self.frame.winfo_width())
 
 
+class TextWidthCache(object):
+    """
+    Measures the width in pixels of strings in a font. The width of each character is measured once with
+    font.measure and the width of a string is the sum of its character widths (kerning is ignored).
+    String widths are cached. Use TextWidthCache.get(tkfont) to get the cache shared by all widgets for a font.
+    """
+    _caches = {}
+    max_strings = 100000
+
+    def __init__(self, tkfont):
+        self.font = tkfont
+        self._chars = {}
+        self._strings = {}
+
+    @classmethod
+    def get(cls, tkfont):
+        key = tuple(sorted(tkfont.actual().items()))
+        if key not in cls._caches:
+            cls._caches[key] = cls(tkfont)
+        return cls._caches[key]
+
+    def measure(self, text):
+        width = self._strings.get(text)
+        if width is None:
+            chars = self._chars
+            width = 0
+            for char in text:
+                char_width = chars.get(char)
+                if char_width is None:
+                    char_width = chars[char] = self.font.measure(char)
+                width += char_width
+            if len(self._strings) >= self.max_strings:
+                self._strings = {}
+            self._strings[text] = width
+        return width
+
+
 class TableWidget(tk.Frame):
     """
     Table based on ttk.TreeView widget.
     Sorting functionality etc. taken from:
     https://stackoverflow.com/questions/32051780/how-to-edit-the-style-of-a-heading-in-treeview-python-ttk
+
+    All rows given to set_table are kept in a Python side store (self._data).
+    With virtual=True only the rows that fit in the viewport (plus overscan rows) are materialized in the treeview.
+    The tree items are recycled when scrolling so the number of items is independent of the number of rows.
+
+    formats is a dict with printf style formats for the displayed values of columns, ex. {'temp': '%.2f'}.
+
+    If key_column is given the table can be refreshed with update_table which only applies the difference
+    between the current rows and the new rows.
+
+    Rows can be filtered with set_filter (one filter per column). Filters are evaluated as numpy masks over the
+    row store and combined with filter_mode 'and' or 'or'. Only the set of rows shown in the tree is changed.
+
+    Rows can be streamed into the table with append_rows/stream_rows. If max_rows is given the oldest rows are
+    evicted when the table grows beyond max_rows. With follow_tail=True the table scrolls to the last row after an
+    append, but only if it was already scrolled to the bottom.
+
+    column_dtypes is a dict with the type used when sorting a column: 'int', 'float', 'datetime', 'natural' or 'str'
+    (default). Columns in int_columns are sorted as 'int'. Sort keys are cached until the rows change.
+    categorical_columns is a list of columns stored dictionary encoded in the row store, or 'auto' for string columns
+    with few distinct values (see TableData). Sorting and filtering of encoded columns work on the categories.
+    Click a column header to sort on that column, shift-click to add the column as an additional sort key.
+    The sort and the filters are kept when rows are added and when the table is reloaded (reset_table followed by
+    set_table or set_table_frame). If the reloaded rows have the same sort keys and filtered values as before the sort
+    order and filter mask from before the reload are reused.
+
+    search finds rows with a cell containing a text (case insensitive) using a trigram index over the displayed
+    cell strings. With search_box=True the index is built in chunks scheduled with after() when rows have been added,
+    else on the first search. The index is then updated when rows are added or removed.
+    Matches are highlighted with the tag 'search_match' and navigated with search_next/search_previous.
+    With search_box=True an entry for searching is shown below the table.
+
+    With show_footer=True a footer below the table shows count, min, max, mean and distinct count per column for the
+    rows passing the filters. The aggregates are updated incrementally when rows are appended or deleted and
+    recomputed (vectorized) when the filters change. See also get_aggregates.
+
+    With virtual=True the rows can instead be read from a data source set with set_data_source, ex. a
+    SqliteTableSource or a MemmapTableSource (memory mapped .npy or Arrow file). Only the visible rows are fetched
+    from the source and sorting, filters and aggregates are evaluated by the source (ORDER BY and WHERE for sqlite).
+    Search and export are only available for the row store.
+
+    With selectmode='extended' several rows can be selected. get_selection_indices returns the selected rows as a
+    numpy array of indices in the row store and the callbacks in callback_select_indices are called with it
+    (indices=...). In virtual mode shift-click selects the whole range from the last clicked row, also rows that
+    are not materialized.
+
+    fit_columns sets the column widths from the headings and a stratified sample of the rows. With auto_fit=True
+    the columns are fitted when a data source is set and widened (never narrowed) to fit a sample of added rows.
+
+    set_group_columns groups the shown rows on one or more columns. Each group is shown as an expandable parent row
+    with the number of rows and an aggregate (mean, sum, min, max or count) of the numeric columns. The member rows
+    are put in the tree only when a group is opened. In virtual mode the rows of a closed group are removed from the
+    tree again. Open groups are kept open when the rows, sorting or filters change.
+
+    detail_provider is a callable that loads detail data for a row (called with the row as a dict on a worker
+    thread). Results are kept in an LRU cache (detail_cache_size rows) and when a row is selected the details of the
+    nr_prefetch rows before and after it are loaded in the background. The callbacks in callback_select then get the
+    keyword argument detail: the result if it is available, else a concurrent.futures.Future.
+
+    With column_window=True only the columns that fit in the widget are displayed (displaycolumns) and the horizontal
+    scrollbar moves the window of displayed columns. Columns in pinned_columns are always displayed first.
+    The footer displays the same columns.
+
+    Conditional formatting rules (add_format_rule) give rows a tree tag when a column fulfills the given criteria.
+    The rules are evaluated as boolean masks over the whole store and the tags are applied in batches
+    (in virtual mode only to the displayed rows).
     """
+    SEARCH_TAG = 'search_match'
+    SEARCH_INDEX_CHUNK_SIZE = 10000
+    COLUMN_PADDING = 16
+
     def __init__(self,
                  parent=False,
                  prop_frame={},
@@ -4246,6 +4356,27 @@ class TableWidget(tk.Frame):
                  int_columns=[],
                  callback_select=[],
                  callback_rightclick=None,
+                 callback_select_indices=[],
+                 selectmode='browse',
+                 virtual=False,
+                 overscan=5,
+                 formats={},
+                 key_column=None,
+                 filter_mode='and',
+                 max_rows=None,
+                 follow_tail=False,
+                 column_dtypes={},
+                 categorical_columns=None,
+                 search_box=False,
+                 show_footer=False,
+                 footer_stats=('count', 'min', 'max', 'mean', 'distinct'),
+                 auto_fit=False,
+                 max_column_width=400,
+                 detail_provider=None,
+                 detail_cache_size=64,
+                 nr_prefetch=2,
+                 column_window=False,
+                 pinned_columns=[],
                  **kwargs):
 
         self.parent = parent
@@ -4258,10 +4389,15 @@ class TableWidget(tk.Frame):
 
         self.callback_rightclick = callback_rightclick
 
+        if not isinstance(callback_select_indices, list):
+            self.callback_select_indices_targets = [callback_select_indices]
+        else:
+            self.callback_select_indices_targets = callback_select_indices
+
         self.prop_frame = {}
         self.prop_frame.update(prop_frame)
 
-        self.prop_treeview = {'selectmode': 'browse'}
+        self.prop_treeview = {'selectmode': selectmode}
         self.prop_treeview.update(prop_treeview)
 
         self.grid_frame = {'padx': 5,
@@ -4275,8 +4411,69 @@ class TableWidget(tk.Frame):
 
         self.columns = columns[:]
         self.int_columns = int_columns
+        self.column_dtypes = {col: 'int' for col in int_columns}
+        self.column_dtypes.update(column_dtypes)
+
+        self.virtual = virtual
+        self.overscan = overscan
+        self.formats = dict(formats)
+        self.key_column = key_column
+        self.filter_mode = filter_mode
+        self.max_rows = max_rows
+        self.follow_tail = follow_tail
+        self.search_box = search_box
+        self.show_footer = show_footer
+        self.footer_stats = list(footer_stats)
+        self.auto_fit = auto_fit
+        self.max_column_width = max_column_width
+        self.column_window = column_window
+        self.pinned_columns = [col for col in pinned_columns if col in self.columns]
+
+        self._data = TableData(self.columns, dtypes=self.column_dtypes, categorical=categorical_columns)
+        self._order = np.array([], dtype=int)  # Indices in self._data in sorted order
+        self._filters = {}
+        self._mask = None  # Boolean array over self._data, None if no filter is active
+        self._view = np.array([], dtype=int)  # Indices in self._data in displayed order (sorted and filtered)
+        self._sort_columns = []  # List of (col, descending)
+        self._first = 0  # Position in self._view of the first materialized row
+        self._nr_visible = 0
+        self._slots = []  # Recycled tree items
+        self._slot_rows = []  # Row index shown in each slot
+        self._selected_rows = set()
+        self._anchor_position = None  # Position in the view of the last clicked row (virtual mode)
+        self._replace_selection = False
+        self._load_job = None
+        self._pending_start = None  # First row added by a chunked load that has not been sorted and filtered yet
+        self._stream_job = None
+        self._export_stop_event = None
+        self._export_job = None
+        self._search_index = None  # SearchIndex over the displayed cells of the first self._nr_indexed rows
+        self._nr_indexed = 0
+        self._search_index_job = None
+        self._search_text = ''
+        self._search_ids = set()  # Ids of the rows matching the search
+        self._search_hits = np.array([], dtype=int)  # Positions in self._view of matching rows
+        self._search_position = -1
+        self._search_iids = set()  # Tree items tagged as search match
+        self._format_rules = collections.OrderedDict()  # ColumnFilter per formatting tag
+        self._format_masks = None  # Boolean array over self._data per formatting tag, see _get_format_masks
+        self._format_version = None  # Version of self._data when self._format_masks was computed
+        self._aggregates = None  # Dict with ColumnAggregate per column for the filtered rows
+        self._source = None  # Data source shown instead of the row store (see set_data_source)
+        self._reload_state = None  # Sort order and filter mask saved by reset_table, see _add_to_order
+        self._group_columns = []
+        self._group_aggregate = 'mean'
+        self._groups = None  # Dict with the groups shown in the tree, see _refresh_groups
+        self._open_group_keys = set()
+        self._first_column = 0  # Position in the scrolled (not pinned) columns of the first displayed column
+        self.detail_provider = None
+        self.detail_cache_size = detail_cache_size
+        self.nr_prefetch = nr_prefetch
+        self._details = collections.OrderedDict()  # Future with the detail data per row key
+        self._detail_executor = None
 
         self._set_frame()
+        self.set_detail_provider(detail_provider, cache_size=detail_cache_size, nr_prefetch=nr_prefetch)
 
     def _set_frame(self):
         self.tree = ttk.Treeview(self, columns=self.columns, show="headings", **self.prop_treeview)
@@ -4296,40 +4493,375 @@ class TableWidget(tk.Frame):
 
         self.tree.config(**self.prop_treeview)
 
+        for col in self.columns:
+            self.tree.heading(col, text=col, command=lambda c=col: self._on_click_heading(c))
+
         grid_configure(self, nr_rows=1, nr_columns=2, c0=20)
 
         # Bindings
         self.tree.bind('<<TreeviewSelect>>', self._callback_select)
+        self.tree.bind('<Shift-Button-1>', self._on_shift_click)
+        self.tree.bind('<<TreeviewOpen>>', self._on_tree_open)
+        self.tree.bind('<<TreeviewClose>>', self._on_tree_close)
+
+        if self.virtual:
+            self._nr_visible = int(self.tree.cget('height'))
+            self.yscrollbar.configure(command=self._on_virtual_yview)
+            self.tree.configure(yscrollcommand=self._on_virtual_tree_yscroll)
+            self.tree.bind('<Configure>', self._on_virtual_configure)
+            self.tree.bind('<MouseWheel>', self._on_virtual_mousewheel)
+            self.tree.bind('<Button-4>', lambda event: self._on_virtual_scroll_units(-3))
+            self.tree.bind('<Button-5>', lambda event: self._on_virtual_scroll_units(3))
+            self.tree.bind('<Up>', self._on_virtual_key_up)
+            self.tree.bind('<Button-1>', self._on_virtual_click)
 
         if self.callback_rightclick:
             MenuWidget(self.tree, bind_widget=self.tree, items=[{'name': 'Show filter', 'command': self.callback_rightclick}])
 
+        self.tree.tag_configure(self.SEARCH_TAG, background='#ffe680')
+        if self.show_footer:
+            self._set_frame_footer()
+        if self.search_box:
+            self._set_frame_search()
+        if self.column_window:
+            self._set_frame_column_window()
+
+    def _set_frame_column_window(self):
+        self.xscrollbar = ttk.Scrollbar(self, orient='horizontal', command=self._on_column_xview)
+        self.xscrollbar.grid(row=1, column=0, sticky='ew')
+        for col in self.columns:
+            self.tree.column(col, stretch=False)
+        self.tree.bind('<Configure>', lambda event: self._update_column_window(), add='+')
+        self.tree.bind('<ButtonRelease-1>', lambda event: self._update_column_window(), add='+')
+        self.tree.bind('<Shift-MouseWheel>', self._on_column_mousewheel)
+        self.tree.bind('<Shift-Button-4>', lambda event: self._scroll_columns_to(self._first_column - 1))
+        self.tree.bind('<Shift-Button-5>', lambda event: self._scroll_columns_to(self._first_column + 1))
+        self._update_column_window()
+
+    def _set_frame_footer(self):
+        self.footer = ttk.Treeview(self, columns=self.columns, show='', selectmode='none',
+                                   height=len(self.footer_stats))
+        self.footer.grid(row=2, column=0, sticky='ew')
+        for stat in self.footer_stats:
+            self.footer.insert('', 'end', iid=stat, values=[stat] * len(self.columns))
+        # Column widths follow the table (after resizing with the mouse)
+        self.tree.bind('<ButtonRelease-1>', self._sync_footer_widths, add='+')
+        self._sync_footer_widths()
+
+    def _set_frame_search(self):
+        frame = tk.Frame(self)
+        frame.grid(row=3, column=0, columnspan=2, sticky='ew')
+
+        tk.Label(frame, text='Search:').grid(row=0, column=0, sticky='w')
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(frame, textvariable=self.search_var)
+        self.search_entry.grid(row=0, column=1, sticky='ew')
+        ttk.Button(frame, text='<', width=2, command=self.search_previous).grid(row=0, column=2)
+        ttk.Button(frame, text='>', width=2, command=self.search_next).grid(row=0, column=3)
+        self.search_label = tk.Label(frame, text='')
+        self.search_label.grid(row=0, column=4, sticky='w')
+        grid_configure(frame, nr_columns=5, c1=10)
+
+        self.search_var.trace_add('write', lambda *args: self.search(self.search_var.get()))
+        self.search_entry.bind('<Return>', lambda event: self.search_next())
+        self.search_entry.bind('<Shift-Return>', lambda event: self.search_previous())
+
     def _callback_select(self, event=None):
+        if self._is_windowed() and not self._sync_virtual_selection():
+            # Selection was only redrawn after scrolling
+            return
+        self._call_select_targets()
+
+    def _call_select_targets(self):
+        kwargs = {}
+        if self.detail_provider is not None and self.callback_select_targets:
+            kwargs['detail'] = self._get_selected_detail()
         for callback in self.callback_select_targets:
-            callback(**self.get_selected())
+            callback(**self.get_selected(), **kwargs)
+        if self.callback_select_indices_targets:
+            indices = self.get_selection_indices()
+            for callback in self.callback_select_indices_targets:
+                callback(indices=indices)
+
+    def get_selection_indices(self):
+        """
+        Returns the indices in the row store of the selected rows (sorted) as a numpy array.
+        When showing a data source the row ids of the source are returned.
+        :return:
+        """
+        if self._is_windowed():
+            return np.sort(np.fromiter(self._selected_rows, dtype=np.int64, count=len(self._selected_rows)))
+        iids = [iid for iid in self.tree.selection() if not iid.startswith('group_')]
+        return np.sort(self._data.get_indices(iids))
 
     def get_selected(self):
-        selection = self.tree.selection()
-        item_dict = self.tree.item(selection)
-        return_dict = {col: value for col, value in zip(self.columns, item_dict['values'])}
-        return return_dict
+        """
+        Returns the (first) selected row as a dict. Values are read from the row store and keep their original types.
+        :return:
+        """
+        rows = self.get_selection_indices()
+        if not len(rows):
+            return {}
+        return self._get_row_dict(int(rows[0]))
+
+    def _get_row_dict(self, row):
+        if self._source is not None:
+            return self._source.get_row_dict(row)
+        return self._data.get_row_dict(row)
+
+    def _get_row_key(self, row):
+        """
+        Returns a key for the row that does not change when other rows are deleted.
+        """
+        if self._source is not None:
+            return ('source', row)
+        return self._data.ids[row]
+
+    def set_detail_provider(self, provider, cache_size=64, nr_prefetch=2, max_workers=2):
+        """
+        Sets the callable that loads detail data for a row. See class doc. None removes the provider.
+        :param provider: callable taking the row as a dict
+        :param cache_size: max number of rows with cached details
+        :param nr_prefetch: number of rows before and after the selected row to load in the background
+        :param max_workers: number of worker threads
+        :return:
+        """
+        self._clear_details()
+        self.detail_provider = provider
+        self.detail_cache_size = cache_size
+        self.nr_prefetch = nr_prefetch
+        if provider is not None and self._detail_executor is None:
+            self._detail_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                                          thread_name_prefix='table_detail')
+
+    def get_detail(self, row):
+        """
+        Returns a Future with the detail data for the row at index row in the store (row id for a data source).
+        The Future is taken from the cache or submitted to the worker threads.
+        :param row:
+        :return:
+        """
+        key = self._get_row_key(row)
+        future = self._details.get(key)
+        if future is not None:
+            self._details.move_to_end(key)
+            return future
+        # The row is read here since the store is only accessed on the GUI thread
+        future = self._detail_executor.submit(self.detail_provider, self._get_row_dict(row))
+        self._details[key] = future
+        while len(self._details) > self.detail_cache_size:
+            self._details.popitem(last=False)[1].cancel()
+        return future
+
+    def _get_selected_detail(self):
+        rows = self.get_selection_indices()
+        if not len(rows):
+            return None
+        future = self.get_detail(int(rows[0]))
+        for row in self._get_neighbour_rows(self.nr_prefetch):
+            if self._get_row_key(row) not in self._details:
+                self.get_detail(row)
+        if future.done() and not future.cancelled() and future.exception() is None:
+            return future.result()
+        return future
+
+    def _get_neighbour_rows(self, nr):
+        """
+        Returns the rows shown before and after the focused row (closest first).
+        :param nr: number of rows in each direction
+        :return: list of row indices (row ids for a data source)
+        """
+        focus = self.tree.focus()
+        if not focus or not nr:
+            return []
+        if self._is_windowed():
+            position = self._get_slot_position(focus)
+            if position is None:
+                return []
+            start = max(0, position - nr)
+            rows = self._get_view_rows(start, position + nr + 1).tolist()
+            distances = [abs(start + k - position) for k in range(len(rows))]
+            return [row for distance, row in sorted(zip(distances, rows)) if distance]
+        iids = []
+        prev_iid = next_iid = focus
+        for _ in range(nr):
+            prev_iid = prev_iid and self.tree.prev(prev_iid)
+            next_iid = next_iid and self.tree.next(next_iid)
+            iids.extend(iid for iid in (next_iid, prev_iid) if iid and not iid.startswith('group_'))
+        return self._data.get_indices(iids).tolist()
+
+    def _clear_details(self):
+        for future in self._details.values():
+            future.cancel()
+        self._details = collections.OrderedDict()
+
+    def destroy(self):
+        # Jobs scheduled with after() must not run on the destroyed tree
+        self.stop_stream()
+        self._pending_start = None
+        self.cancel_load()
+        self.cancel_export()
+        self._cancel_search_index()
+        self._clear_details()
+        if self._detail_executor is not None:
+            self._detail_executor.shutdown(wait=False)
+            self._detail_executor = None
+        tk.Frame.destroy(self)
+
+    def export(self, file_path, file_format=None, chunk_size=10000, callback_progress=None, callback_done=None,
+               **kwargs):
+        """
+        Exports the rows shown in the table (filtered and sorted) to a csv or parquet file.
+        Rows are read from the row store in chunks on a background thread. The rows shown when the export starts are
+        exported. Callbacks are called on the GUI thread.
+        :param file_path:
+        :param file_format: 'csv' or 'parquet' (requires pyarrow). Taken from the file extension if not given.
+        :param chunk_size: number of rows written per chunk
+        :param callback_progress: called with (nr_rows_written, nr_rows)
+        :param callback_done: called with (file_path, error) when the export is finished. error is None on success.
+        :param kwargs: passed to csv.writer, ex. delimiter='\t'
+        :return:
+        """
+        if self._source is not None:
+            raise ValueError('export is not available when showing a data source')
+        if file_format is None:
+            file_format = 'parquet' if os.path.splitext(file_path)[1].lower() in ('.parquet', '.pq') else 'csv'
+        if file_format == 'parquet':
+            export_function = export_parquet
+        elif file_format == 'csv':
+            export_function = export_csv
+        else:
+            raise ValueError('Unknown file_format: {}'.format(file_format))
+
+        self.cancel_export()
+        stop_event = threading.Event()
+        self._export_stop_event = stop_event
+        status = {'progress': None, 'done': False, 'error': None}
+
+        def set_progress(nr_rows, nr_total):
+            status['progress'] = (nr_rows, nr_total)
+
+        # The thread only gets references to the column lists and a copy of the view
+        columns = list(self.columns)
+        values = [self._data.get_column_values(col) for col in columns]
+        indices = self._view.copy()
+
+        def run():
+            try:
+                export_function(file_path,
+                                columns,
+                                values,
+                                indices,
+                                chunk_size=chunk_size,
+                                callback_progress=set_progress,
+                                stop_event=stop_event,
+                                **kwargs)
+            except Exception as e:
+                logger.error('Export to {} failed: {}'.format(file_path, e))
+                status['error'] = e
+            status['done'] = True
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self._export_job = self.after(100, self._poll_export, status, stop_event, file_path, callback_progress,
+                                      callback_done)
+
+    def _poll_export(self, status, stop_event, file_path, callback_progress, callback_done):
+        progress = status['progress']
+        status['progress'] = None
+        if progress and callback_progress:
+            callback_progress(*progress)
+        if not status['done']:
+            self._export_job = self.after(100, self._poll_export, status, stop_event, file_path, callback_progress,
+                                          callback_done)
+            return
+        self._export_job = None
+        if self._export_stop_event is stop_event:
+            self._export_stop_event = None
+        if callback_done and not stop_event.is_set():
+            callback_done(file_path, status['error'])
+
+    def cancel_export(self):
+        """
+        Stops a running export. callback_done is not called for a cancelled export.
+        :return:
+        """
+        if self._export_stop_event:
+            self._export_stop_event.set()
+            self._export_stop_event = None
+        if self._export_job:
+            self.after_cancel(self._export_job)
+            self._export_job = None
 
     def get_filtered_items(self):
-        children = self.tree.get_children('')
-        return_list = []
-        for c in children:
-            item_dict = self.tree.item(c)
-            c_dict = {col: value for col, value in zip(self.columns, item_dict['values'])}
-            return_list.append(c_dict)
-        return return_list
+        """
+        Returns the rows shown in the table, in displayed order, as a list of dicts.
+        :return:
+        """
+        if self._source is not None:
+            return [dict(zip(self.columns, row)) for row in self._source.iter_rows()]
+        return [self._data.get_row_dict(index) for index in self._view]
+
+    def set_data_source(self, source):
+        """
+        Shows the rows of a data source, ex. a SqliteTableSource, instead of rows given to set_table.
+        Requires virtual=True. The source is removed by reset_table.
+        :param source:
+        :return:
+        """
+        if not self.virtual:
+            raise ValueError('set_data_source requires virtual=True')
+        if self._group_columns:
+            raise ValueError('Grouping is not available for a data source')
+        self.reset_table()
+        self._clear_details()
+        self._reload_state = None
+        source.set_columns(self.columns)
+        source.set_sort(self._sort_columns)
+        source.set_filters(list(self._filters.values()), self.filter_mode)
+        self._source = source
+        self._refresh_virtual()
+        self._update_footer()
+        if self.auto_fit:
+            self.fit_columns()
 
     def reset_table(self):
         """
-        Deletes all items in the treeview.
+        Deletes all items in the treeview. A data source set with set_data_source is removed.
+        Sorting and filters are kept and applied to the rows added next.
         :return:
         """
-        for i in self.tree.get_children():
-            self.tree.delete(i)
+        loading = self._pending_start is not None
+        # The rows of a load in progress are not sorted and filtered yet and are not saved for the reload
+        self._pending_start = None
+        self.cancel_load()
+        if not loading:
+            self._save_reload_state()
+        self._delete_groups()
+        # Filtered rows are detached from the tree and not listed by get_children
+        if self.virtual:
+            self.tree.delete(*self._slots)
+        else:
+            self.tree.delete(*self._data.get_iids(range(len(self._data))))
+        self._data.clear()
+        self._order = np.array([], dtype=int)
+        self._mask = None
+        self._view = np.array([], dtype=int)
+        self._first = 0
+        self._slots = []
+        self._slot_rows = []
+        self._selected_rows = set()
+        self._anchor_position = None
+        self._cancel_search_index()
+        self._search_ids = set()
+        self._search_hits = np.array([], dtype=int)
+        self._search_position = -1
+        self._search_iids = set()
+        self._aggregates = None
+        if self._source is not None:
+            self._clear_details()
+        self._source = None
+        self._update_footer()
 
     def set_table(self, data_rows):
         """
@@ -4338,65 +4870,1293 @@ class TableWidget(tk.Frame):
         :param data_rows_rows:
         :return:
         """
-        # for col in self.columns:
-        #     self.tree.heading(col, text=col.title(), command=lambda c=col: sortby(self.tree, c, 0))
+        self._insert_rows(self._data.add_rows(data_rows))
+
+    def _insert_rows(self, added, display_rows=None, final=True):
+        """
+        Shows rows that have been added to the store.
+        :param added: range of added row indices
+        :param display_rows: iterable with the values to show for each added row. Taken from the store if not given.
+        :param final: False if more rows are about to be added (chunked load). The rows are then only appended:
+                      sorting, filters, grouping, formatting and search are applied once to all loaded rows
+                      by the final call.
+        :return:
+        """
+        start = added.start if self._pending_start is None else self._pending_start
+        self._pending_start = None if final else start
+        self._add_to_order(added, final=final)
+        if self._aggregates is not None:
+            if final or not self._filters:
+                self._add_to_aggregates(added, add=True)
+            else:
+                self._aggregates = None
+        if self._search_index is not None and self._nr_indexed == added.start:
+            self._index_rows(added.stop)
+
+        if self.virtual:
+            if final or self._is_windowed():
+                self._refresh_virtual()
+        else:
+            if display_rows is None:
+                display_rows = (self._get_display_row(index) for index in added)
+            for iid, values in zip(self._data.get_iids(added), display_rows):
+                self.tree.insert('', 'end', iid=iid, values=values, tags=('items',))
+            if final:
+                self._apply_format_tags(np.arange(start, added.stop))
+                if self._filters or self._group_columns or self._sort_columns:
+                    self._apply_view()
+        if final:
+            self._refresh_search()
+            self._schedule_search_index()
+        if final or not self._filters:
+            self._update_footer()
+        if self.auto_fit and len(added):
+            positions = get_sample_indices(len(added), 100) + added.start
+            self._set_column_widths(self.columns, [self._get_display_row(index) for index in positions], shrink=False)
+
+    def append_rows(self, data_rows):
+        """
+        Adds rows at the end of the table. Oldest rows are evicted if the table grows beyond max_rows.
+        If follow_tail is set and the table was scrolled to the bottom it is scrolled to show the new rows.
+        :param data_rows:
+        :return:
+        """
+        at_bottom = self._is_at_bottom()
+        added = self._data.add_rows(data_rows)
+        if not added:
+            return
+        self._insert_rows(added)
+
+        if self.max_rows and len(self._data) > self.max_rows:
+            self._delete_rows(range(len(self._data) - self.max_rows))
+            if self.virtual:
+                self._refresh_virtual()
+            elif self._group_columns:
+                self._apply_view()
+
+        if self.follow_tail and at_bottom:
+            self.scroll_to_end()
+
+    def stream_rows(self, source, batch_size=500, interval=100):
+        """
+        Appends rows from source in batches on the GUI thread (scheduled with after()).
+        A previous stream is stopped.
+        :param source: iterable of rows, or a thread safe queue (queue.Queue or multiprocessing.Queue) that rows
+                       are put on from other threads. An iterable is streamed until exhausted,
+                       a queue until stop_stream is called.
+        :param batch_size: max number of rows added per batch
+        :param interval: milliseconds between polls when no more rows are available
+        :return:
+        """
+        self.stop_stream()
+        if not hasattr(source, 'get_nowait'):
+            source = iter(source)
+        self._stream_job = self.after(1, self._poll_stream, source, batch_size, interval)
+
+    def _poll_stream(self, source, batch_size, interval):
+        done = False
+        if hasattr(source, 'get_nowait'):
+            rows = []
+            try:
+                while len(rows) < batch_size:
+                    rows.append(source.get_nowait())
+            except queue.Empty:
+                pass
+        else:
+            rows = list(itertools.islice(source, batch_size))
+            done = len(rows) < batch_size
+
+        if rows:
+            self.append_rows(rows)
+
+        if done:
+            self._stream_job = None
+        else:
+            delay = 1 if len(rows) == batch_size else interval
+            self._stream_job = self.after(delay, self._poll_stream, source, batch_size, interval)
+
+    def stop_stream(self):
+        if self._stream_job:
+            self.after_cancel(self._stream_job)
+            self._stream_job = None
+
+    def set_follow_tail(self, follow_tail):
+        self.follow_tail = bool(follow_tail)
+
+    def _is_at_bottom(self):
+        if self._is_windowed():
+            return self._first + self._nr_visible >= self._get_nr_view_rows()
+        return self.tree.yview()[1] >= 1.
+
+    def scroll_to_end(self):
+        if self._is_windowed():
+            self._scroll_virtual_to(self._get_nr_view_rows())
+        else:
+            self.tree.yview_moveto(1.)
+
+    def _add_to_order(self, added, final=True):
+        """
+        Adds the new rows to the order, sorts on the active sort columns and updates the filter mask.
+        After a reload with unchanged rows the order and mask saved by reset_table are reused.
+        :param added: range of added row indices
+        :param final: False to add the rows unsorted at the end of the order (more rows are about to be added)
+        :return:
+        """
+        self._order = np.concatenate([self._order, np.arange(added.start, added.stop)]).astype(int)
+        if not final:
+            self._mask = None
+            self._update_view()
+            return
+        state = self._reload_state
+        self._reload_state = None
+        if state is not None and self._sort_columns and state['sort_columns'] == self._sort_columns and \
+                self._is_reload_unchanged(state['sort_arrays'], self._get_sort_arrays()):
+            self._order = state['order']
+        elif self._sort_columns:
+            self._order = self._data.argsort(self._sort_columns)
+        if state is not None and self._filters and state['filters'] == self._get_filter_key() and \
+                self._is_reload_unchanged(state['filter_arrays'], self._get_filter_arrays()):
+            self._mask = state['mask']
+            self._update_view()
+        else:
+            self._update_mask()
+
+    def _save_reload_state(self):
+        """
+        Saves the sort order and filter mask with the arrays they were computed from before the rows are removed.
+        The arrays are normally cached in the store from the last sort and filter, so they are not computed again here.
+        """
+        self._reload_state = None
+        if not len(self._data) or self._source is not None or not (self._sort_columns or self._filters):
+            return
+        self._reload_state = {'sort_columns': list(self._sort_columns),
+                              'sort_arrays': self._get_sort_arrays(),
+                              'order': self._order,
+                              'filters': self._get_filter_key(),
+                              'filter_arrays': self._get_filter_arrays(),
+                              'mask': self._mask}
+
+    def _get_sort_arrays(self):
+        return [self._data.get_sort_keys(col) for col, descending in self._sort_columns]
+
+    def _get_filter_arrays(self):
+        return [array for col in sorted(self._filters) for array in self._filters[col].get_arrays(self._data)]
+
+    def _is_reload_unchanged(self, old_arrays, arrays):
+        """
+        Returns True if the arrays of the reloaded rows are equal to the arrays saved by reset_table.
+        Compared vectorized, nan values are equal.
+        """
+        return len(arrays) == len(old_arrays) and all(
+            np.array_equal(array, old_array, equal_nan=array.dtype.kind == 'f')
+            for array, old_array in zip(arrays, old_arrays))
+
+    def _get_filter_key(self):
+        return self.filter_mode, [repr(self._filters[col]) for col in sorted(self._filters)]
+
+    def update_table(self, data_rows):
+        """
+        Updates the table with data_rows using the key_column given at init.
+        Only the difference is applied: new rows are added at the end, rows with keys not in data_rows are deleted
+        and changed rows are updated in place. Scroll position and selection are kept.
+        :param data_rows:
+        :return:
+        """
+        if not self.key_column:
+            raise ValueError('update_table requires a key_column')
+        if not len(self._data):
+            self.set_table(data_rows)
+            return
+        self.cancel_load()
+
+        deleted, changed, added = get_row_diff(self._data, self.key_column, data_rows)
+        if not (deleted or changed or added):
+            return
+
+        if deleted:
+            new_indices = self._delete_rows(deleted)
+            changed = [(int(new_indices[index]), row) for index, row in changed]
+
+        changed_columns = set()
+        for index, row in changed:
+            old_row = self._data.get_row(index)
+            changed_columns.update(col for col, old_value, value in zip(self.columns, old_row, row)
+                                   if not values_equal(old_value, value))
+            self._details.pop(self._data.ids[index], None)
+            indexed = index < self._nr_indexed
+            if indexed:
+                self._search_index.remove_rows([self._data.ids[index]], [self._get_display_row(index)])
+            if self._aggregates is not None:
+                self._add_to_aggregates([index], add=False)
+            self._data.update_row(index, row)
+            if indexed:
+                self._search_index.add_rows([self._data.ids[index]], [self._get_display_row(index)])
+            if not self.virtual:
+                self.tree.item(self._data.get_iids([index])[0], values=self._get_display_row(index))
+
+        # Deleted rows have already been removed from the tree and the order.
+        # Added rows are sorted and filtered together with the changed rows by set_table.
+        view_changed = False
+        if changed_columns & {col for col, descending in self._sort_columns} and not added:
+            self._order = self._data.argsort(self._sort_columns)
+            self._update_view()
+            view_changed = True
+        if changed_columns & set(self._filters):
+            # The changed rows are added to the aggregates if they pass the new mask
+            self._update_mask()
+            view_changed = True
+        if changed:
+            if self._aggregates is not None:
+                self._add_to_aggregates([index for index, row in changed], add=True)
+            if not self.virtual:
+                self._apply_format_tags(np.array([index for index, row in changed]))
+        if added:
+            self.set_table(added)
+            return
+        if (view_changed and not self.virtual) or self._group_columns:
+            self._apply_view()
+        else:
+            if self.virtual:
+                self._refresh_virtual()
+            self._refresh_search()
+        self._update_footer()
+
+    def _delete_rows(self, indices):
+        """
+        Deletes rows from the store and the tree.
+        :param indices: row indices in the store
+        :return: array mapping old row index to new row index (-1 for deleted rows)
+        """
+        indices = list(indices)
+        if self._aggregates is not None:
+            self._add_to_aggregates(indices, add=False)
+        indexed = [index for index in indices if index < self._nr_indexed]
+        if indexed:
+            self._search_index.remove_rows([self._data.ids[index] for index in indexed],
+                                           (self._get_display_row(index) for index in indexed))
+            self._nr_indexed -= len(indexed)
+        iids = self._data.get_iids(indices)
+        self._search_iids.difference_update(iids)
+        if self.virtual:
+            self._sync_virtual_selection()
+        else:
+            self.tree.delete(*iids)
+        new_indices = self._data.delete_rows(indices)
+        self._remap_rows(new_indices)
+        self._refresh_search()
+        self._update_footer()
+        return new_indices
+
+    def _remap_rows(self, new_indices):
+        """
+        Updates the view and the selection after rows have been deleted from the store.
+        :param new_indices: array mapping old row index to new row index (-1 for deleted rows)
+        :return:
+        """
+        if self.virtual:
+            # Keep the same rows on screen
+            self._first -= int(np.count_nonzero(new_indices[self._view[:self._first]] < 0))
+        order = new_indices[self._order]
+        self._order = order[order >= 0]
+        if self._mask is not None:
+            self._mask = self._mask[new_indices >= 0]
+        self._update_view()
+        self._selected_rows = {int(new_indices[row]) for row in self._selected_rows if new_indices[row] >= 0}
+        self._slot_rows = [int(new_indices[row]) for row in self._slot_rows]
+
+    def set_table_frame(self, frame, chunk_size=5000, callback_progress=None):
+        """
+        Sets the table with data from a pandas DataFrame or a numpy structured array. Columns are picked by name.
+        The old content is removed. The rows are formatted column wise and inserted in chunks
+        scheduled with after() so that the GUI stays responsive. A new load (or reset_table) cancels a load in progress.
+
+        :param frame: pandas DataFrame or numpy structured array
+        :param chunk_size: number of rows inserted per chunk
+        :param callback_progress: called with (nr_loaded_rows, nr_rows) after each chunk
+        :return:
+        """
+        self.reset_table()
+        arrays = get_frame_columns(frame, self.columns)
+        nr_rows = len(arrays[0]) if arrays else 0
+        self._load_chunk(arrays, 0, nr_rows, chunk_size, callback_progress)
+
+    def _load_chunk(self, arrays, start, nr_rows, chunk_size, callback_progress):
+        stop = min(start + chunk_size, nr_rows)
+        chunk = [values[start:stop] for values in arrays]
+        added = self._data.add_columns([values.tolist() for values in chunk])
+        display_rows = None
+        if not self.virtual:
+            # Only the rows of the chunk are formatted
+            display_rows = zip(*[format_column(values, self.formats.get(col)).tolist()
+                                 for col, values in zip(self.columns, chunk)])
+        self._insert_rows(added, display_rows=display_rows, final=stop >= nr_rows)
+
+        if callback_progress:
+            callback_progress(stop, nr_rows)
+
+        if stop < nr_rows:
+            self._load_job = self.after(1, self._load_chunk, arrays, stop, nr_rows, chunk_size, callback_progress)
+        else:
+            self._load_job = None
+
+    def cancel_load(self):
+        """
+        Cancels a load started by set_table_frame. Rows already inserted are kept (and sorted and filtered).
+        :return:
+        """
+        if self._load_job:
+            self.after_cancel(self._load_job)
+            self._load_job = None
+        if self._pending_start is not None:
+            # Sort and filter the rows loaded so far
+            self._insert_rows(range(len(self._data), len(self._data)))
+
+    def _get_display_row(self, index):
+        """
+        Returns the values shown in the tree for the given row index.
+        :param index:
+        :return:
+        """
+        return self._format_row(self._data.get_row(index))
 
+    def _format_row(self, row):
+        return tuple(map(format_value, row, [self.formats.get(col) for col in self.columns]))
+
+    def _on_click_heading(self, col):
+        """
+        Sorts the table on col when a column header is clicked on. Clicking the same column again sorts descending.
+        Missing values stay last and equal values keep their order. The permutation is computed on cached sort keys
+        and applied to the tree in one operation.
+        :param col:
+        :return:
+        """
+        descending = False
+        if len(self._sort_columns) == 1 and self._sort_columns[0][0] == col:
+            descending = not self._sort_columns[0][1]
+        self.sort_by([(col, descending)])
+
+    def _on_shift_click(self, event):
+        region = self.tree.identify_region(event.x, event.y)
+        if region == 'heading':
+            return self._on_shift_click_heading(event)
+        if self._is_windowed() and region in ('cell', 'tree'):
+            return self._on_virtual_shift_click(event)
+
+    def _on_shift_click_heading(self, event):
+        """
+        Adds the clicked column as the last sort key, or reverses it if it already is a sort key.
+        """
+        col = self._get_column_at(event.x)
+        if col is None:
+            return 'break'
+        sort_columns = list(self._sort_columns)
+        for k, (sort_col, descending) in enumerate(sort_columns):
+            if sort_col == col:
+                sort_columns[k] = (col, not descending)
+                break
+        else:
+            sort_columns.append((col, False))
+        self.sort_by(sort_columns)
+        return 'break'
+
+    def _get_column_at(self, x):
+        """
+        Returns the data column at x, or None for the tree column (#0) shown in grouped mode.
+        """
+        index = int(self.tree.identify_column(x)[1:]) - 1
+        if index < 0:
+            return None
+        displaycolumns = self.tree['displaycolumns']
+        if displaycolumns in ('#all', ('#all',)):
+            return self.columns[index]
+        return displaycolumns[index]
+
+    def sort_by(self, sort_columns):
+        """
+        Sorts the table on one or more columns with a stable sort.
+        :param sort_columns: list of (col, descending) or col. The first column is the primary sort key.
+        :return:
+        """
+        self._sort_columns = [(item, False) if isinstance(item, str) else (item[0], bool(item[1]))
+                              for item in sort_columns]
+        if self._source is not None:
+            self._source.set_sort(self._sort_columns)
+        else:
+            self._order = self._data.argsort(self._sort_columns)
+        self._update_sort()
+
+    def get_sort_columns(self):
+        return list(self._sort_columns)
+
+    def _update_sort(self):
+        self._update_view()
+        self._apply_view()
+        self._update_headings()
+
+    def clear_sort(self):
+        """
+        Removes the sorting. Rows are shown in the order they were added.
+        :return:
+        """
+        if self._source is not None:
+            self._source.set_sort([])
+        else:
+            self._order = np.arange(len(self._data))
+        self._sort_columns = []
+        self._update_sort()
+
+    def _update_headings(self):
+        arrows = {col: ' \u25bc' if descending else ' \u25b2' for col, descending in self._sort_columns}
         for col in self.columns:
-            if col in self.int_columns:
-                self.tree.heading(col, text=col,
-                                  command=lambda c=col: sortby_int(self.tree, c, False))
+            self.tree.heading(col, text=col + arrows.get(col, ''))
+
+    def set_filter(self, col, **criteria):
+        """
+        Sets the filter for column col. Replaces any previous filter on the column.
+        :param col:
+        :param criteria: keyword arguments to ColumnFilter, ex. equals='B', min_value=0, max_value=10,
+                         contains='st', regex='^ST[0-9]+$', isin=['A', 'B'], case_sensitive=False
+        :return:
+        """
+        self._filters[col] = ColumnFilter(col, **criteria)
+        self._apply_filters()
+
+    def remove_filter(self, col):
+        if self._filters.pop(col, None) is None:
+            return
+        self._apply_filters()
+
+    def clear_filters(self):
+        self._filters = {}
+        self._apply_filters()
+
+    def set_filter_mode(self, filter_mode):
+        """
+        :param filter_mode: 'and' or 'or'
+        :return:
+        """
+        self.filter_mode = filter_mode
+        self._apply_filters()
+
+    def get_filters(self):
+        return dict(self._filters)
+
+    def add_format_rule(self, name, col, prop_tag={}, **criteria):
+        """
+        Adds a conditional formatting rule. Rows where column col fulfills the criteria get the tree tag name,
+        configured with prop_tag. Replaces any previous rule with the same name.
+        Rules are not applied to rows from a data source (see set_data_source).
+        :param name: name of the rule, used as tag in the tree
+        :param col:
+        :param prop_tag: options to Treeview.tag_configure, ex. {'background': '#ff9999'}
+                         or {'font': ('TkDefaultFont', 9, 'bold')}
+        :param criteria: keyword arguments to ColumnFilter, ex. equals='B' or min_value=10
+        :return:
+        """
+        if name in self._format_rules:
+            self.remove_format_rule(name)
+        self._format_rules[name] = ColumnFilter(col, **criteria)
+        self._format_masks = None
+        self.tree.tag_configure(name, **prop_tag)
+        self._refresh_formats()
+
+    def remove_format_rule(self, name):
+        if self._format_rules.pop(name, None) is None:
+            return
+        self._format_masks = None
+        tagged = self.tree.tag_has(name)
+        if tagged:
+            self.tree.tk.call(self.tree, 'tag', 'remove', name, list(tagged))
+
+    def clear_format_rules(self):
+        for name in list(self._format_rules):
+            self.remove_format_rule(name)
+
+    def get_format_rules(self):
+        return dict(self._format_rules)
+
+    def _get_format_masks(self):
+        """
+        Returns a dict with a boolean array over the store per formatting rule. Recomputed when the rows have changed.
+        :return:
+        """
+        if self._format_masks is None or self._format_version != self._data.version:
+            self._format_masks = {name: rule.get_mask(self._data) for name, rule in self._format_rules.items()}
+            self._format_version = self._data.version
+        return self._format_masks
+
+    def _get_format_tags(self, rows):
+        """
+        Returns a tuple with the formatting tags for each of the given rows.
+        :param rows: row indices in the store
+        :return:
+        """
+        tags = [() for _ in range(len(rows))]
+        if not self._format_rules or self._source is not None or self._pending_start is not None:
+            # Rules are evaluated when a chunked load is done
+            return tags
+        rows = np.asarray(rows, dtype=int)
+        for name, mask in self._get_format_masks().items():
+            for k in np.flatnonzero(mask[rows]).tolist():
+                tags[k] += (name,)
+        return tags
+
+    def _apply_format_tags(self, rows=None):
+        """
+        Sets the formatting tags on the tree items of the given rows, or on all items if rows is None.
+        Not used when the tree holds recycled slots, see _refresh_virtual.
+        :param rows: array with row indices in the store
+        :return:
+        """
+        if not self._format_rules or self._source is not None:
+            return
+        retag_all = rows is None
+        if retag_all and self.virtual:
+            # Grouped: only the rows of open groups are in the tree
+            rows = np.concatenate([np.array([], dtype=int)] +
+                                  [self._get_group_rows(k) for k in (self._groups or {}).get('opened', [])])
+        elif retag_all:
+            rows = np.arange(len(self._data))
+        for name, mask in self._get_format_masks().items():
+            tagged = self.tree.tag_has(name) if retag_all else self._data.get_iids(rows)
+            iids = self._data.get_iids(rows[mask[rows]])
+            if tagged:
+                self.tree.tk.call(self.tree, 'tag', 'remove', name, list(tagged))
+            if iids:
+                self.tree.tk.call(self.tree, 'tag', 'add', name, list(iids))
+
+    def _refresh_formats(self):
+        if self._is_windowed():
+            self._refresh_virtual()
+        else:
+            self._apply_format_tags()
+
+    def _apply_filters(self):
+        self._aggregates = None
+        if self._source is not None:
+            self._source.set_filters(list(self._filters.values()), self.filter_mode)
+        self._update_mask()
+        self._apply_view()
+        self._update_footer()
+
+    def get_aggregates(self):
+        """
+        Returns count, min, max, mean and distinct count for each column, for the rows passing the filters.
+        :return: dict with one dict per column
+        """
+        if self._source is not None:
+            return self._source.get_aggregates()
+        return {col: aggregate.get_stats() for col, aggregate in self._get_aggregates().items()}
+
+    def _get_aggregates(self):
+        if self._aggregates is None:
+            self._aggregates = {col: ColumnAggregate.from_column(self._data, col, mask=self._mask)
+                                for col in self.columns}
+        return self._aggregates
+
+    def _add_to_aggregates(self, indices, add=True):
+        """
+        Adds (or removes) the rows at the given indices to the aggregates if they pass the filters.
+        :param indices: row indices in the store
+        :param add: False to remove the rows
+        :return:
+        """
+        indices = np.asarray(list(indices), dtype=int)
+        if self._mask is not None:
+            indices = indices[self._mask[indices]]
+        if not len(indices):
+            return
+        for col, aggregate in self._aggregates.items():
+            values = self._data.get_column_values(col)
+            values = [values[index] for index in indices.tolist()]
+            if add:
+                aggregate.add(values)
             else:
-                self.tree.heading(col, text=col,
-                                  command=lambda c=col: sortby(self.tree, c, False))
-        for item in data_rows:
-            self.tree.insert('', 'end', values=item, tags=('items',))
-
-        def sortby(tree, col, descending):
-            """sort tree contents when a column header is clicked on"""
-            # grab values to sort
-            data = [(tree.set(child, col), child) for child in tree.get_children('')]
-            # if the data to be sorted is numeric change to float
-            # data =  change_numeric(data)
-            # now sort the data in place
-            data.sort(reverse=descending)
-            for ix, item in enumerate(data):
-                tree.move(item[1], '', ix)
-            # switch the heading so it will sort in the opposite direction
-            tree.heading(col, command=lambda col=col: sortby(tree, col, int(not descending)))
-
-
-        def sortby_int(tv, col, reverse):
-            """
-            https://stackoverflow.com/questions/22032152/python-ttk-treeview-sort-numbers
-            :param tv:
-            :param col:
-            :param reverse:
-            :return:
-            """
-            l = [(tv.set(k, col), k) for k in tv.get_children('')]
-            l.sort(key=lambda t: int(t[0]), reverse=reverse)
-            #      ^^^^^^^^^^^^^^^^^^^^^^^
-
-            for index, (val, k) in enumerate(l):
-                tv.move(k, '', index)
-
-            tv.heading(col,
-                       command=lambda: sortby_int(tv, col, not reverse))
-
-        # root = Tk()
-        # columns = ('number',)
-        # treeview = ttk.Treeview(root, columns=columns, show='headings')
-        # for t in ('1', '10', '11', '2', '3'):
-        #     treeview.insert('', END, values=(t,))
-        # treeview.pack()
-        # for col in columns:
-        #     treeview.heading(col, text=col,
-        #                      command=lambda c=col: treeview_sort_column(treeview, c, False))
+                aggregate.remove(values)
+
+    def _update_footer(self):
+        if not self.show_footer:
+            return
+        stats = self.get_aggregates()
+        for stat in self.footer_stats:
+            values = []
+            for col in self.columns:
+                value = stats[col][stat]
+                if value is None:
+                    values.append('')
+                    continue
+                if isinstance(value, float):
+                    fmt = self.formats.get(col) or '%.6g'
+                    value = fmt % value
+                values.append('{} {}'.format(stat, value))
+            self.footer.item(stat, values=values)
+
+    def fit_columns(self, columns=None, sample_size=200):
+        """
+        Sets the width of the columns to fit the heading and the displayed values of a stratified sample of the rows.
+        :param columns: columns to fit, all columns if not given
+        :param sample_size: approximate number of rows measured
+        :return:
+        """
+        nr_rows = self._get_nr_view_rows()
+        rows = []
+        if self._source is not None:
+            # Contiguous blocks so that only a few pages are read from the source
+            nr_strata = 8
+            nr_per_stratum = -(-sample_size // nr_strata)
+            for start in range(0, nr_rows, max(1, nr_rows // nr_strata)):
+                rows.extend(self._format_row(row) for row in self._source.get_rows(start, start + nr_per_stratum)[1])
+        else:
+            rows = [self._get_display_row(index) for index in self._view[get_sample_indices(nr_rows, sample_size)]]
+        self._set_column_widths(columns or self.columns, rows, shrink=True)
+
+    def _set_column_widths(self, columns, rows, shrink=True):
+        """
+        Sets the width of the columns to fit the heading and the given display rows. Only the longest strings
+        (by number of characters) in each column are measured.
+        :param columns:
+        :param rows: display rows
+        :param shrink: False to only make columns wider
+        :return:
+        """
+        style = self.tree.cget('style') or 'Treeview'
+        cell_widths = TextWidthCache.get(_get_font(self, ttk.Style(self).lookup(style, 'font') or 'TkDefaultFont'))
+        heading_widths = TextWidthCache.get(_get_font(self, 'TkHeadingFont'))
+        for col in columns:
+            k = self.columns.index(col)
+            longest = heapq.nlargest(10, {str(row[k]) for row in rows}, key=len)
+            # Room for the sort arrow
+            width = max([heading_widths.measure(col + ' \u25b2')] + [cell_widths.measure(text) for text in longest])
+            width = min(self.max_column_width, width + self.COLUMN_PADDING)
+            if not shrink:
+                width = max(width, int(self.tree.column(col, 'width')))
+            self.tree.column(col, width=width)
+        if self.show_footer:
+            self._sync_footer_widths()
+        if self.column_window:
+            self._update_column_window()
+
+    def _sync_footer_widths(self, event=None):
+        for col in self.columns:
+            self.footer.column(col, width=self.tree.column(col, 'width'))
+
+    def _get_scrolled_columns(self):
+        return [col for col in self.columns if col not in self.pinned_columns]
+
+    def set_pinned_columns(self, columns):
+        """
+        Sets the columns that are always displayed (first) when column_window is used.
+        :param columns:
+        :return:
+        """
+        self.pinned_columns = [col for col in columns if col in self.columns]
+        self._first_column = 0
+        self._update_column_window()
+
+    def scroll_to_column(self, col):
+        """
+        Scrolls the column window so that col is the first scrolled column.
+        :param col:
+        :return:
+        """
+        scrolled_columns = self._get_scrolled_columns()
+        if col in scrolled_columns:
+            self._scroll_columns_to(scrolled_columns.index(col))
+
+    def _scroll_columns_to(self, first):
+        first = max(0, min(first, len(self._get_scrolled_columns()) - 1))
+        if first == self._first_column:
+            return
+        self._first_column = first
+        self._update_column_window()
+
+    def _update_column_window(self):
+        """
+        Displays the pinned columns and the scrolled columns, from self._first_column, that fit in the tree.
+        """
+        if not self.column_window:
+            return
+        scrolled_columns = self._get_scrolled_columns()
+        self._first_column = max(0, min(self._first_column, len(scrolled_columns) - 1))
+        available = self.tree.winfo_width() - sum(int(self.tree.column(col, 'width')) for col in self.pinned_columns)
+        last = self._first_column
+        # Include the column that is partly visible
+        while last < len(scrolled_columns) and available > 0:
+            available -= int(self.tree.column(scrolled_columns[last], 'width'))
+            last += 1
+        last = max(last, min(self._first_column + 1, len(scrolled_columns)))
+        displaycolumns = self.pinned_columns + scrolled_columns[self._first_column:last]
+        self.tree.configure(displaycolumns=displaycolumns)
+        if self.show_footer:
+            self.footer.configure(displaycolumns=displaycolumns)
+        if scrolled_columns:
+            self.xscrollbar.set(self._first_column / len(scrolled_columns), last / len(scrolled_columns))
+        else:
+            self.xscrollbar.set(0., 1.)
+
+    def _on_column_xview(self, *args):
+        """
+        Command for the horizontal scrollbar with column_window. Same arguments as tree.xview.
+        """
+        if args[0] == 'moveto':
+            self._scroll_columns_to(int(float(args[1]) * len(self._get_scrolled_columns())))
+        elif args[0] == 'scroll':
+            nr = int(args[1])
+            if args[2] == 'pages':
+                nr *= max(1, len(self.tree['displaycolumns']) - len(self.pinned_columns) - 1)
+            self._scroll_columns_to(self._first_column + nr)
+
+    def _on_column_mousewheel(self, event):
+        self._scroll_columns_to(self._first_column + (-1 if event.delta > 0 else 1))
+        return 'break'
+
+    def _update_mask(self):
+        """
+        Evaluates the active filters over the row store and updates the view.
+        :return:
+        """
+        if not self._filters:
+            self._mask = None
+        else:
+            masks = [column_filter.get_mask(self._data) for column_filter in self._filters.values()]
+            if self.filter_mode == 'or':
+                self._mask = np.logical_or.reduce(masks)
+            else:
+                self._mask = np.logical_and.reduce(masks)
+        self._update_view()
+
+    def _update_view(self):
+        if self._mask is None:
+            self._view = self._order
+        else:
+            self._view = self._order[self._mask[self._order]]
+
+    def _apply_view(self):
+        """
+        Shows the rows in self._view (in that order) in the tree. In normal mode this is one call to the tree
+        where filtered rows are detached.
+        :return:
+        """
+        if self._group_columns:
+            self._refresh_groups()
+        elif self.virtual:
+            self._anchor_position = None
+            self._refresh_virtual()
+        else:
+            self.tree.set_children('', *self._data.get_iids(self._view))
+        self._refresh_search()
+
+    def _is_windowed(self):
+        """
+        Returns True if the rows are shown in the recycled items of the virtual mode (virtual and not grouped).
+        """
+        return self.virtual and not self._group_columns
+
+    def set_group_columns(self, columns, aggregate='mean'):
+        """
+        Groups the shown rows on the given columns. An empty list removes the grouping.
+        :param columns: list of columns
+        :param aggregate: aggregate of the numeric columns shown in the group rows: 'mean', 'sum', 'min', 'max' or 'count'
+        :return:
+        """
+        if columns and self._source is not None:
+            raise ValueError('Grouping is not available for a data source')
+        was_grouped = bool(self._group_columns)
+        self._delete_groups()
+        self._group_columns = list(columns)
+        self._group_aggregate = aggregate
+        self._open_group_keys = set()
+        if self.virtual:
+            if self._group_columns and not was_grouped:
+                # The tree scrolls itself while grouped
+                self.tree.delete(*self._slots)
+                self._slots = []
+                self._slot_rows = []
+                self.yscrollbar.configure(command=self.tree.yview)
+                self.tree.configure(yscrollcommand=self.yscrollbar.set)
+            elif was_grouped and not self._group_columns:
+                self.yscrollbar.configure(command=self._on_virtual_yview)
+                self.tree.configure(yscrollcommand=self._on_virtual_tree_yscroll)
+        if self._group_columns:
+            self.tree.configure(show='tree headings')
+            self.tree.heading('#0', text=' / '.join(self._group_columns))
+        else:
+            self.tree.configure(show='headings')
+        self._apply_view()
+
+    def get_group_columns(self):
+        return list(self._group_columns)
+
+    def _refresh_groups(self):
+        """
+        Groups the rows in the view and shows one (closed) tree item per group. Groups that were open are opened.
+        """
+        self._delete_groups()
+        if not self.virtual:
+            # Detach the rows, they are attached to their group when it is opened
+            self.tree.set_children('')
+        keys, starts, counts, ordered_rows = get_groups(self._data, self._group_columns, self._view)
+        self._groups = {'keys': keys, 'starts': starts, 'counts': counts, 'rows': ordered_rows, 'opened': set()}
+        if not keys:
+            return
+        values = []
+        for col in self.columns:
+            if col in self._group_columns:
+                k = self._group_columns.index(col)
+                values.append([key[k] for key in keys])
+                continue
+            floats = self._data.get_typed_column(col, 'float')[ordered_rows]
+            fmt = self.formats.get(col) or '%.6g'
+            values.append(['' if np.isnan(value) else fmt % value
+                           for value in aggregate_groups(floats, starts, self._group_aggregate).tolist()])
+        for k, (key, count, group_values) in enumerate(zip(keys, counts.tolist(), zip(*values))):
+            iid = 'group_{}'.format(k)
+            text = '{} ({})'.format(' / '.join(str(value) for value in key), count)
+            self.tree.insert('', 'end', iid=iid, text=text, values=group_values, tags=('group',))
+            # Placeholder so that the group can be opened
+            self.tree.insert(iid, 'end', iid=iid + '_')
+        for k, key in enumerate(keys):
+            if key in self._open_group_keys:
+                self._open_group(k)
+                self.tree.item('group_{}'.format(k), open=True)
+
+    def _delete_groups(self):
+        if self._groups is None:
+            return
+        nr_groups = len(self._groups['keys'])
+        if not self.virtual:
+            # Keep the row items that are attached to open groups
+            for k in self._groups['opened']:
+                self.tree.set_children('group_{}'.format(k))
+        self.tree.delete(*['group_{}'.format(k) for k in range(nr_groups)])
+        if self.virtual:
+            self._search_iids = set()
+        self._groups = None
+
+    def _get_group_rows(self, k):
+        start = self._groups['starts'][k]
+        return self._groups['rows'][start:start + self._groups['counts'][k]]
+
+    def _open_group(self, k):
+        """
+        Puts the rows of group k in the tree (as children of the group item).
+        """
+        if k in self._groups['opened']:
+            return
+        self._groups['opened'].add(k)
+        iid = 'group_{}'.format(k)
+        self.tree.delete(iid + '_')
+        rows = self._get_group_rows(k)
+        if self.virtual:
+            ids = self._data.ids
+            for row, format_tags in zip(rows.tolist(), self._get_format_tags(rows)):
+                row_iid = str(ids[row])
+                tags = ('items',)
+                if ids[row] in self._search_ids:
+                    tags = ('items', self.SEARCH_TAG)
+                    self._search_iids.add(row_iid)
+                self.tree.insert(iid, 'end', iid=row_iid, values=self._get_display_row(row), tags=tags + format_tags)
+        else:
+            self.tree.set_children(iid, *self._data.get_iids(rows))
+
+    def _open_group_of_row(self, row):
+        """
+        Opens the group holding the row at index row in the store.
+        """
+        positions = np.flatnonzero(self._groups['rows'] == row)
+        if not len(positions):
+            return
+        k = int(np.searchsorted(self._groups['starts'], positions[0], side='right')) - 1
+        self._open_group(k)
+        self._open_group_keys.add(self._groups['keys'][k])
+        self.tree.item('group_{}'.format(k), open=True)
+
+    def _get_event_group(self):
+        iid = self.tree.focus()
+        if self._groups is None or not iid.startswith('group_'):
+            return None
+        return int(iid.split('_')[1])
+
+    def _on_tree_open(self, event=None):
+        k = self._get_event_group()
+        if k is None:
+            return
+        self._open_group(k)
+        self._open_group_keys.add(self._groups['keys'][k])
+
+    def _on_tree_close(self, event=None):
+        k = self._get_event_group()
+        if k is None:
+            return
+        self._open_group_keys.discard(self._groups['keys'][k])
+        if self.virtual and k in self._groups['opened']:
+            # Release the row items of the group
+            iid = 'group_{}'.format(k)
+            children = self.tree.get_children(iid)
+            self._search_iids.difference_update(children)
+            self.tree.delete(*children)
+            self.tree.insert(iid, 'end', iid=iid + '_')
+            self._groups['opened'].discard(k)
+
+    def _get_nr_view_rows(self):
+        if self._source is not None:
+            return len(self._source)
+        return len(self._view)
+
+    def _get_view_rows(self, start, stop):
+        """
+        Returns the row indices (row ids for a data source) shown at positions start to stop.
+        :param start:
+        :param stop:
+        :return: numpy array
+        """
+        if self._source is not None:
+            return np.asarray(self._source.get_row_ids(start, stop), dtype=np.int64)
+        return self._view[start:stop]
+
+    def search(self, text):
+        """
+        Highlights the rows with a cell containing text (case insensitive) and scrolls to the first match.
+        Use search_next/search_previous to select matches. An empty text clears the search.
+        :param text:
+        :return: number of matching rows shown in the table
+        """
+        self._search_text = str(text)
+        self._search_position = -1
+        self._refresh_search()
+        if len(self._search_hits):
+            self._see_view_position(self._search_hits[0])
+        return len(self._search_hits)
+
+    def search_next(self):
+        self._step_search(1)
+
+    def search_previous(self):
+        self._step_search(-1)
+
+    def _step_search(self, step):
+        if not len(self._search_hits):
+            return
+        if self._search_position < 0 and step < 0:
+            self._search_position = 0
+        self._search_position = (self._search_position + step) % len(self._search_hits)
+        self._select_view_position(self._search_hits[self._search_position])
+        self._update_search_label()
+
+    def _get_search_index(self):
+        """
+        Returns the search index. Rows that have not been indexed in the background yet are indexed first.
+        """
+        if self._search_index_job:
+            self.after_cancel(self._search_index_job)
+            self._search_index_job = None
+        self._index_rows(len(self._data))
+        return self._search_index
+
+    def _index_rows(self, stop):
+        """
+        Adds the rows from self._nr_indexed to stop to the search index.
+        """
+        if self._search_index is None:
+            self._search_index = SearchIndex()
+        start = self._nr_indexed
+        if stop <= start:
+            return
+        self._search_index.add_rows(self._data.ids[start:stop], (self._get_display_row(index)
+                                                                 for index in range(start, stop)))
+        self._nr_indexed = stop
+
+    def _schedule_search_index(self):
+        """
+        Starts indexing the rows not indexed yet in chunks scheduled with after() so that the first search in the
+        search box does not block the GUI.
+        """
+        if not self.search_box or self._search_index_job or self._nr_indexed >= len(self._data):
+            return
+        self._search_index_job = self.after(1, self._build_search_index)
+
+    def _build_search_index(self):
+        self._index_rows(min(self._nr_indexed + self.SEARCH_INDEX_CHUNK_SIZE, len(self._data)))
+        if self._nr_indexed < len(self._data):
+            self._search_index_job = self.after(1, self._build_search_index)
+        else:
+            self._search_index_job = None
+
+    def _cancel_search_index(self):
+        if self._search_index_job:
+            self.after_cancel(self._search_index_job)
+            self._search_index_job = None
+        self._search_index = None
+        self._nr_indexed = 0
+
+    def _refresh_search(self):
+        """
+        Updates the matching rows and the highlighting after the search text, the rows or the view has changed.
+        :return:
+        """
+        if not self._search_text and not self._search_ids:
+            return
+        if self._search_text:
+            self._search_ids = self._get_search_index().search(self._search_text)
+        else:
+            self._search_ids = set()
+        ids = self._data.get_id_array()[self._view]
+        self._search_hits = np.flatnonzero(np.isin(ids, np.fromiter(self._search_ids, dtype=np.int64,
+                                                                      count=len(self._search_ids))))
+        self._search_position = min(self._search_position, len(self._search_hits) - 1)
+
+        if self._is_windowed():
+            self._refresh_virtual()
+        else:
+            if self._search_iids:
+                self.tree.tk.call(self.tree, 'tag', 'remove', self.SEARCH_TAG, list(self._search_iids))
+            self._search_iids = set(self._data.get_iids(self._view[self._search_hits]))
+            if self.virtual:
+                # Grouped: only the rows of open groups are in the tree
+                self._search_iids = {iid for iid in self._search_iids if self.tree.exists(iid)}
+            if self._search_iids:
+                self.tree.tk.call(self.tree, 'tag', 'add', self.SEARCH_TAG, list(self._search_iids))
+        self._update_search_label()
+
+    def _update_search_label(self):
+        if not self.search_box:
+            return
+        if not self._search_text:
+            text = ''
+        elif self._search_position < 0:
+            text = '{} matches'.format(len(self._search_hits))
+        else:
+            text = '{}/{}'.format(self._search_position + 1, len(self._search_hits))
+        self.search_label.config(text=text)
+
+    def _see_view_position(self, position):
+        """
+        Scrolls the table so that the row at position in the view is visible.
+        :param position:
+        :return:
+        """
+        if self._is_windowed():
+            if not self._first <= position < self._first + self._nr_visible:
+                self._scroll_virtual_to(position - self._nr_visible // 2)
+        else:
+            if self._group_columns:
+                self._open_group_of_row(int(self._view[position]))
+            self.tree.see(self._data.get_iids([self._view[position]])[0])
+
+    def _select_view_position(self, position):
+        """
+        Selects (and shows) the row at position in the view. Select callbacks are called.
+        :param position:
+        :return:
+        """
+        row = int(self._view[position])
+        if self._is_windowed():
+            self._sync_virtual_selection()
+            self._selected_rows = {row}
+            if not self._first <= position < self._first + self._nr_visible:
+                self._first = position - self._nr_visible // 2
+            self._refresh_virtual(sync_selection=False)
+            self._call_select_targets()
+        else:
+            if self._group_columns:
+                self._open_group_of_row(row)
+            iid = self._data.get_iids([row])[0]
+            self.tree.selection_set(iid)
+            self.tree.focus(iid)
+            self.tree.see(iid)
+
+    def _row_height(self):
+        style = self.tree.cget('style') or 'Treeview'
+        try:
+            return int(ttk.Style(self).lookup(style, 'rowheight'))
+        except (ValueError, tk.TclError):
+            return 20
+
+    def _sync_virtual_selection(self):
+        """
+        Reads the selected tree items and updates the stored selection of rows.
+        Rows that are selected but not materialized are kept selected unless the tree is in browse mode.
+        :return: True if the stored selection has changed
+        """
+        slot_index = {iid: k for k, iid in enumerate(self._slots)}
+        rows = {self._slot_rows[slot_index[iid]] for iid in self.tree.selection() if iid in slot_index}
+        rows.discard(-1)
+        if rows and (self._replace_selection or str(self.tree.cget('selectmode')) == 'browse'):
+            selected_rows = rows
+            self._replace_selection = False
+        else:
+            selected_rows = (self._selected_rows - set(self._slot_rows)) | rows
+        if selected_rows == self._selected_rows:
+            return False
+        self._selected_rows = selected_rows
+        return True
+
+    def _refresh_virtual(self, sync_selection=True):
+        """
+        Materializes the rows self._view[self._first:] that fit in the viewport (plus overscan) in the recycled tree items.
+        :param sync_selection: False if self._selected_rows has been set and should not be updated from the tree
+        :return:
+        """
+        if self._group_columns:
+            self._refresh_groups()
+            return
+        # Keep selection and focus made in the tree since the last redraw
+        selection_changed = sync_selection and self._sync_virtual_selection()
+        focus_row = None
+        focus = self.tree.focus()
+        if focus in self._slots:
+            focus_row = self._slot_rows[self._slots.index(focus)]
+
+        total = self._get_nr_view_rows()
+        self._first = max(0, min(self._first, total - self._nr_visible))
+        nr_slots = max(0, min(self._nr_visible + self.overscan, total - self._first))
+        while len(self._slots) < nr_slots:
+            self._slots.append(self.tree.insert('', 'end', tags=('items',)))
+        while len(self._slots) > nr_slots:
+            self.tree.delete(self._slots.pop())
+
+        if self._source is not None:
+            # Rows are identified by the row ids of the source
+            self._slot_rows, rows = self._source.get_rows(self._first, self._first + nr_slots)
+            display_rows = [self._format_row(row) for row in rows]
+        else:
+            self._slot_rows = self._view[self._first:self._first + nr_slots].tolist()
+            display_rows = (self._get_display_row(row) for row in self._slot_rows)
+        selection = []
+        ids = self._data.ids
+        format_tags = self._get_format_tags(self._slot_rows)
+        for iid, row, values, row_tags in zip(self._slots, self._slot_rows, display_rows, format_tags):
+            if self._search_ids and ids[row] in self._search_ids:
+                tags = ('items', self.SEARCH_TAG)
+            else:
+                tags = ('items',)
+            self.tree.item(iid, values=values, tags=tags + row_tags)
+            if row in self._selected_rows:
+                selection.append(iid)
+            if row == focus_row:
+                self.tree.focus(iid)
+        self.tree.selection_set(selection)
+        self.tree.yview_moveto(0)
+
+        if total:
+            self.yscrollbar.set(self._first / total, min(1., (self._first + self._nr_visible) / total))
+        else:
+            self.yscrollbar.set(0., 1.)
+
+        if selection_changed:
+            self._call_select_targets()
+
+    def _scroll_virtual_to(self, first):
+        first = max(0, min(first, self._get_nr_view_rows() - self._nr_visible))
+        if first == self._first:
+            return
+        self._first = first
+        self._refresh_virtual()
+
+    def _on_virtual_scroll_units(self, nr):
+        if not self._is_windowed():
+            return
+        self._scroll_virtual_to(self._first + nr)
+        return 'break'
+
+    def _on_virtual_yview(self, *args):
+        """
+        Command for the vertical scrollbar in virtual mode. Same arguments as tree.yview.
+        """
+        if args[0] == 'moveto':
+            self._scroll_virtual_to(int(float(args[1]) * self._get_nr_view_rows()))
+        elif args[0] == 'scroll':
+            nr = int(args[1])
+            if args[2] == 'pages':
+                nr *= max(1, self._nr_visible - 1)
+            self._scroll_virtual_to(self._first + nr)
+
+    def _on_virtual_tree_yscroll(self, first, last):
+        """
+        The tree scrolls itself when focus moves into the overscan rows (keyboard navigation, see() etc.).
+        The materialized window is then moved so that the tree can be scrolled back to top.
+        """
+        first = float(first)
+        if first <= 0 or not self._slots:
+            return
+        offset = int(round(first * len(self._slots)))
+        if offset:
+            self._scroll_virtual_to(self._first + offset)
+
+    def _on_virtual_mousewheel(self, event):
+        if abs(event.delta) >= 120:
+            nr = -int(event.delta / 120) * 3
+        else:
+            nr = -event.delta
+        return self._on_virtual_scroll_units(nr)
+
+    def _get_slot_position(self, iid):
+        """
+        Returns the position in the view of the row shown in the tree item iid, or None.
+        """
+        if iid not in self._slots:
+            return None
+        return self._first + self._slots.index(iid)
+
+    def _on_virtual_click(self, event):
+        """
+        Remembers the clicked row as anchor for shift-click. A click without ctrl replaces the whole selection,
+        also the selected rows that are not materialized.
+        """
+        position = self._get_slot_position(self.tree.identify_row(event.y))
+        if position is None:
+            return
+        self._anchor_position = position
+        if not event.state & 0x0004:
+            self._replace_selection = True
+
+    def _on_virtual_shift_click(self, event):
+        """
+        Selects the rows from the anchor to the clicked row in extended mode. The selection is kept as row indices
+        so ranges larger than the materialized window are selected without creating tree items.
+        """
+        if str(self.tree.cget('selectmode')) != 'extended':
+            return
+        iid = self.tree.identify_row(event.y)
+        position = self._get_slot_position(iid)
+        if position is None:
+            return
+        anchor = self._anchor_position
+        if anchor is None:
+            anchor = position
+            self._anchor_position = position
+        start, stop = min(anchor, position), max(anchor, position) + 1
+        self._selected_rows = set(self._get_view_rows(start, stop).tolist())
+        self._refresh_virtual(sync_selection=False)
+        self.tree.focus(iid)
+        self._call_select_targets()
+        return 'break'
+
+    def _on_virtual_key_up(self, event):
+        # Scroll one row before the class binding moves focus up from the first item
+        if self._slots and self.tree.focus() == self._slots[0]:
+            self._scroll_virtual_to(self._first - 1)
+
+    def _on_virtual_configure(self, event):
+        nr_visible = max(1, event.height // self._row_height() - 1)
+        if nr_visible == self._nr_visible:
+            return
+        self._nr_visible = nr_visible
+        if self._is_windowed():
+            self._refresh_virtual()
 
 
 class TreeviewWidget(tk.Frame):
     """
-
+    With lazy=True set_treeview_dict only inserts the top level nodes. Nodes with children get a placeholder child
+    and their children are inserted when the node is opened. If a node has 'children' that is not a dict
+    (ex. None) the children are taken from children_provider, called with the path to the node as a tuple of names
+    and returning a dict with the same structure as given to set_treeview_dict.
+    With release_collapsed=True the children of a closed node are deleted from the tree and inserted again
+    when the node is opened.
+
+    All nodes in the dict (also the ones not inserted in lazy mode) are indexed by path and by name.
+    find() searches the names and shows a match by opening its ancestors.
     """
     def __init__(self,
                  parent=False,
@@ -4405,6 +6165,9 @@ class TreeviewWidget(tk.Frame):
                  columns=[],
                  int_columns=[],
                  callback_target=[],
+                 lazy=False,
+                 children_provider=None,
+                 release_collapsed=False,
                  **kwargs):
 
         self.parent = parent
@@ -4432,6 +6195,15 @@ class TreeviewWidget(tk.Frame):
 
         self.columns = columns
         self.int_columns = int_columns
+        self.lazy = lazy
+        self.children_provider = children_provider
+        self.release_collapsed = release_collapsed
+
+        self._nodes = {}  # Path (tuple of names) and node dict per inserted item
+        self._placeholders = set()  # Items with a placeholder child instead of their children
+        self._provided_children = {}  # Children returned by children_provider per item
+        self._path_index = {}  # Item id per path (tuple of names)
+        self._name_index = SearchIndex()  # Paths by node name
 
         self._set_frame()
 
@@ -4465,6 +6237,8 @@ class TreeviewWidget(tk.Frame):
 
         # Bindings
         self.tree.bind('<<TreeviewSelect>>', self._callback_select)
+        self.tree.bind('<<TreeviewOpen>>', self._on_tree_open)
+        self.tree.bind('<<TreeviewClose>>', self._on_tree_close)
 
     def _callback_select(self, event=None):
         if self.callback_targets:
@@ -4509,8 +6283,12 @@ class TreeviewWidget(tk.Frame):
         Deletes all items in the treeview.
         :return:
         """
-        for i in self.tree.get_children():
-            self.tree.delete(i)
+        self.tree.delete(*self.tree.get_children())
+        self._nodes = {}
+        self._placeholders = set()
+        self._provided_children = {}
+        self._path_index = {}
+        self._name_index = SearchIndex()
 
     def set_treeview_dict(self, treeview_dict):
         """
@@ -4520,34 +6298,238 @@ class TreeviewWidget(tk.Frame):
                                          'value': 'Test string'}
         Where 'value' must be initiated as a column in the treview widget.
 
+        The dict is compared with the nodes already in the tree (item id is '<parent id>_<name>') and only the
+        difference is applied: new nodes are inserted, missing nodes are deleted and changed values are updated.
+        Open and selected nodes are kept.
+
         :param treeview_dict:
         :return:
         """
-        def add_level(parent, level_dict):
-            for name in utils.sorted_int(level_dict):
-                key = '{}_{}'.format(parent, name)
-                self.tree.insert(parent, 'end', key, text=name)
-                if 'children' in level_dict[name]:
-                    add_level(key, level_dict[name]['children'])
-
-                for col in level_dict[name]:
-                    if col == 'value':
-                        header = '#1'
-                        self.tree.set(key, header, level_dict[name][col])
-                    elif col.startswith('col'):
-                        header = col.replace('col', '#')
-                        self.tree.set(key, header, level_dict[name][col])
-
-        # First delete old entries
-        self.reset_tree()
-
-        # Then add new data
-        add_level('', treeview_dict)
+        self._update_level('', (), treeview_dict, recursive=not self.lazy)
+        paths = {}
+        self._get_level_paths('', (), treeview_dict, paths)
+        self._update_index(paths)
 
         # Add sorting functionality (not working yet)
         #for col in self.columns:
         #    self.tree.heading(col, text=col, command=lambda: self.treeview_sort_column(self.tree, col, False))
 
+    def _add_level(self, parent, path, level_dict, recursive=True):
+        """
+        Inserts the nodes in level_dict as children of parent.
+        :param parent: item id of the parent
+        :param path: tuple with the names from the top level to the parent
+        :param level_dict: dict with one node dict per name
+        :param recursive: False to give nodes with children a placeholder child instead of inserting the children
+        :return:
+        """
+        for name in sorted_int(level_dict):
+            self._insert_node(parent, path, name, level_dict[name], recursive=recursive)
+
+    def _insert_node(self, parent, path, name, node, recursive=True):
+        key = '{}_{}'.format(parent, name)
+        self.tree.insert(parent, 'end', key, text=name, values=self._get_node_values(node))
+        self._nodes[key] = (path + (name,), node)
+        if 'children' not in node:
+            return
+        if recursive:
+            self._add_level(key, path + (name,), self._get_node_children(key), recursive=True)
+        else:
+            self._insert_placeholder(key)
+
+    def _insert_placeholder(self, key):
+        self.tree.insert(key, 'end', key + '_')
+        self._placeholders.add(key)
+
+    def _update_level(self, parent, path, level_dict, recursive=True):
+        """
+        Applies the difference between level_dict and the children of parent in the tree.
+        :param parent: item id of the parent
+        :param path: tuple with the names from the top level to the parent
+        :param level_dict: dict with one node dict per name
+        :param recursive: False to give new nodes with children a placeholder child
+        :return:
+        """
+        old_keys = self.tree.get_children(parent)
+        old_key_set = set(old_keys)
+        names = sorted_int(level_dict)
+        keys = ['{}_{}'.format(parent, name) for name in names]
+        removed = old_key_set.difference(keys)
+        if removed:
+            self.tree.delete(*removed)
+            self._forget_nodes({self._nodes[key][0] for key in removed if key in self._nodes})
+        for name, key in zip(names, keys):
+            if key in old_key_set:
+                self._update_node(key, path + (name,), level_dict[name], recursive=recursive)
+            else:
+                self._insert_node(parent, path, name, level_dict[name], recursive=recursive)
+        if tuple(keys) != tuple(old_keys):
+            self.tree.set_children(parent, *keys)
+
+    def _update_node(self, key, path, node, recursive=True):
+        """
+        Updates the values and the children of an item that is already in the tree.
+        Children are only compared if they have been inserted (not for a closed node in lazy mode).
+        """
+        old_node = self._nodes[key][1]
+        values = self._get_node_values(node)
+        if values != self._get_node_values(old_node):
+            self.tree.item(key, values=values)
+        self._nodes[key] = (path, node)
+        self._provided_children.pop(key, None)
+        if 'children' not in node:
+            if 'children' in old_node:
+                self.tree.delete(*self.tree.get_children(key))
+                self._placeholders.discard(key)
+                self._forget_nodes({path}, keep_roots=True)
+        elif key in self._placeholders:
+            return
+        elif 'children' in old_node or recursive:
+            self._update_level(key, path, self._get_node_children(key), recursive=recursive)
+        else:
+            self._insert_placeholder(key)
+
+    def _forget_nodes(self, paths, keep_roots=False):
+        """
+        Removes the nodes at the given paths and all their descendants from self._nodes.
+        :param paths: set of paths, all of the same length
+        :param keep_roots: True to only remove the descendants
+        :return:
+        """
+        if not paths:
+            return
+        depth = len(next(iter(paths)))
+        for key in [key for key, (path, node) in self._nodes.items()
+                    if path[:depth] in paths and not (keep_roots and len(path) == depth)]:
+            del self._nodes[key]
+            self._placeholders.discard(key)
+            self._provided_children.pop(key, None)
+
+    def _get_node_values(self, node):
+        """
+        Returns the values of the columns after the tree column for a node dict. 'value' goes in the first column and
+        'col<n>' in column n.
+        """
+        values = [''] * max(0, len(self.columns) - 1)
+        for col, value in node.items():
+            if col == 'value':
+                index = 0
+            elif col.startswith('col') and col[3:].isdigit():
+                index = int(col[3:]) - 1
+            else:
+                continue
+            if 0 <= index < len(values):
+                values[index] = value
+        return values
+
+    def _get_node_children(self, key):
+        path, node = self._nodes[key]
+        children = node['children']
+        if isinstance(children, dict):
+            return children
+        if key not in self._provided_children:
+            if self.children_provider is None:
+                return {}
+            self._provided_children[key] = self.children_provider(path) or {}
+            paths = {}
+            self._get_level_paths(key, path, self._provided_children[key], paths)
+            self._update_index(paths, add_only=True)
+        return self._provided_children[key]
+
+    def _get_level_paths(self, parent, path, level_dict, paths):
+        """
+        Collects the item id per path for level_dict and its children (including children already taken from
+        children_provider) in paths.
+        """
+        for name, node in level_dict.items():
+            key = '{}_{}'.format(parent, name)
+            paths[path + (name,)] = key
+            children = node.get('children')
+            if not isinstance(children, dict):
+                children = self._provided_children.get(key)
+            if children:
+                self._get_level_paths(key, path + (name,), children, paths)
+
+    def _update_index(self, paths, add_only=False):
+        """
+        Updates the path index and the name index.
+        :param paths: dict with item id per path
+        :param add_only: True if paths only holds nodes to add, else paths holds all nodes
+        :return:
+        """
+        added = [path for path in paths if path not in self._path_index]
+        if not add_only:
+            removed = [path for path in self._path_index if path not in paths]
+            self._name_index.remove_rows(removed, [(path[-1],) for path in removed])
+            self._path_index = {}
+        self._path_index.update(paths)
+        self._name_index.add_rows(added, [(path[-1],) for path in added])
+
+    def get_item_id(self, path):
+        """
+        Returns the item id of the node at path, or None if path is not in the tree. The item is not inserted yet
+        if an ancestor has not been opened in lazy mode (see show_path).
+        :param path: sequence of names from the top level
+        :return:
+        """
+        return self._path_index.get(tuple(path))
+
+    def find(self, text, prefix=False, show=True):
+        """
+        Searches the node names (case insensitive).
+        :param text:
+        :param prefix: True to match names starting with text, else names containing text
+        :param show: True to show and select the first match, see show_path
+        :return: sorted list with the paths (tuples of names) of the matching nodes
+        """
+        paths = sorted(self._name_index.search(text, prefix=prefix), key=lambda path: [natural_key(name) for name in path])
+        if show and paths:
+            self.show_path(paths[0])
+        return paths
+
+    def show_path(self, path):
+        """
+        Opens the ancestors of the node at path (inserting children in lazy mode), selects it and scrolls it into view.
+        :param path: sequence of names from the top level
+        :return: item id of the node
+        """
+        path = tuple(path)
+        iid = self._path_index.get(path)
+        if iid is None:
+            raise KeyError(path)
+        for k in range(1, len(path)):
+            key = self._path_index[path[:k]]
+            self._populate_node(key)
+            self.tree.item(key, open=True)
+        self.tree.selection_set(iid)
+        self.tree.focus(iid)
+        self.tree.see(iid)
+        return iid
+
+    def _populate_node(self, key):
+        """
+        Inserts the children of a node that has a placeholder child.
+        """
+        if key not in self._placeholders:
+            return
+        self.tree.delete(key + '_')
+        self._placeholders.discard(key)
+        self._add_level(key, self._nodes[key][0], self._get_node_children(key), recursive=False)
+
+    def _on_tree_open(self, event=None):
+        self._populate_node(self.tree.focus())
+
+    def _on_tree_close(self, event=None):
+        key = self.tree.focus()
+        if not self.release_collapsed or key not in self._nodes or key in self._placeholders:
+            return
+        children = self.tree.get_children(key)
+        if not children:
+            return
+        self.tree.delete(*children)
+        self._forget_nodes({self._nodes[key][0]}, keep_roots=True)
+        self._insert_placeholder(key)
+
 
 class MenuWidget(object):
 
@@ -4758,6 +6740,16 @@ def get_calendar(locale, fwday):
 ================================================================================
 ================================================================================
 """ 
+def _get_font(widget, font_spec):
+    """
+    Returns a tkinter.font.Font for a named font or a font description.
+    """
+    try:
+        return font.nametofont(font_spec)
+    except tk.TclError:
+        return font.Font(root=widget, font=font_spec)
+
+
 def grid_configure(frame, nr_rows=1, nr_columns=1, **kwargs):
     """
     Updated 20180825     
@@ -1,6 +1,8 @@
 # Copyright (c) 2018 SMHI, Swedish Meteorological and Hydrological Institute
 # License: MIT License (see LICENSE.txt or http://opensource.org/licenses/mit).
 
+from .sort_keys import sorted_int
+
 
 """
 ================================================================================
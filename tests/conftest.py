@@ -0,0 +1,293 @@
+import collections
+import itertools
+import tkinter as tk
+from tkinter import ttk
+
+import pytest
+
+from shark_tkinter_lib import tkinter_widgets
+
+
+class FakeTk(object):
+    """
+    Stands in for the Tcl interpreter of a FakeTreeview. Only the tag commands used by the widgets are supported.
+    """
+    def __init__(self, tree):
+        self.tree = tree
+
+    def call(self, widget, command, action, tag, items):
+        assert command == 'tag'
+        for iid in items:
+            tags = self.tree._items[iid]['tags']
+            if action == 'add' and tag not in tags:
+                tags.append(tag)
+            elif action == 'remove' and tag in tags:
+                tags.remove(tag)
+
+
+class FakeTreeview(object):
+    """
+    Python replacement for ttk.Treeview so that the widgets can be tested without a display.
+    Items are kept in a dict and detached items keep their data. Calls are counted per method in self.calls.
+    """
+    def __init__(self, master=None, **kwargs):
+        self.master = master
+        self.tk = FakeTk(self)
+        self.calls = collections.Counter()
+        self._options = {'height': 10, 'selectmode': 'browse', 'style': '', 'displaycolumns': '#all', 'show': 'tree'}
+        self._options.update(kwargs)
+        self._items = {}
+        self._children = {'': []}
+        self._headings = {}
+        self._columns = {}
+        self._tags = {}
+        self._selection = ()
+        self._focus = ''
+        self._counter = itertools.count(1)
+
+    def __getitem__(self, option):
+        return self.cget(option)
+
+    def configure(self, **kwargs):
+        self._options.update(kwargs)
+
+    config = configure
+
+    def cget(self, option):
+        return self._options.get(option, '')
+
+    def grid(self, **kwargs):
+        pass
+
+    def bind(self, sequence, func=None, add=None):
+        pass
+
+    def winfo_width(self):
+        return 1000
+
+    def heading(self, col, option=None, **kwargs):
+        self._headings.setdefault(col, {}).update(kwargs)
+        if option:
+            return self._headings[col].get(option)
+        return dict(self._headings[col])
+
+    def column(self, col, option=None, **kwargs):
+        self._columns.setdefault(col, {'width': 100}).update(kwargs)
+        if option:
+            return self._columns[col].get(option)
+        return dict(self._columns[col])
+
+    def tag_configure(self, tag, **kwargs):
+        self._tags.setdefault(tag, {}).update(kwargs)
+
+    def tag_has(self, tag, item=None):
+        if item is not None:
+            return tag in self._items[item]['tags']
+        return tuple(iid for iid, item in self._items.items() if tag in item['tags'])
+
+    def insert(self, parent, index, iid=None, text='', values=(), tags=(), open=False):
+        if iid is None:
+            iid = 'I{:03d}'.format(next(self._counter))
+        iid = str(iid)
+        if iid in self._items:
+            raise tk.TclError('Item {} already exists'.format(iid))
+        if isinstance(tags, str):
+            tags = (tags,)
+        self._items[iid] = {'text': text, 'values': tuple(values), 'tags': list(tags), 'open': open, 'parent': None}
+        self._children[iid] = []
+        self._attach(iid, parent, index)
+        return iid
+
+    def _attach(self, iid, parent, index='end'):
+        self._detach(iid)
+        children = self._children[parent]
+        if index == 'end':
+            children.append(iid)
+        else:
+            children.insert(int(index), iid)
+        self._items[iid]['parent'] = parent
+
+    def _detach(self, iid):
+        parent = self._items[iid]['parent']
+        if parent is not None:
+            self._children[parent].remove(iid)
+            self._items[iid]['parent'] = None
+
+    def delete(self, *iids):
+        parents = set()
+        stack = [iid for iid in iids if iid in self._items]
+        for iid in stack:
+            parents.add(self._items[iid]['parent'])
+        while stack:
+            iid = stack.pop()
+            if iid not in self._items:
+                continue
+            stack.extend(self._children.pop(iid))
+            del self._items[iid]
+        for parent in parents:
+            if parent in self._children:
+                self._children[parent] = [iid for iid in self._children[parent] if iid in self._items]
+        self._selection = tuple(iid for iid in self._selection if iid in self._items)
+
+    def set_children(self, item, *iids):
+        for iid in self._children[item]:
+            self._items[iid]['parent'] = None
+        moved = set(iids)
+        for parent in {self._items[iid]['parent'] for iid in iids} - {None}:
+            self._children[parent] = [iid for iid in self._children[parent] if iid not in moved]
+        self._children[item] = list(iids)
+        for iid in iids:
+            self._items[iid]['parent'] = item
+
+    def get_children(self, item=''):
+        self.calls['get_children'] += 1
+        return tuple(self._children[item])
+
+    def exists(self, iid):
+        self.calls['exists'] += 1
+        return iid in self._items
+
+    def move(self, iid, parent, index):
+        self._attach(iid, parent, index)
+
+    def parent(self, iid):
+        return self._items[iid]['parent']
+
+    def item(self, iid, option=None, **kwargs):
+        if isinstance(iid, tuple):
+            if not iid:
+                return {'text': '', 'values': '', 'tags': '', 'open': False}
+            iid = iid[0]
+        item = self._items[iid]
+        for key, value in kwargs.items():
+            if key == 'values':
+                value = tuple(value)
+            elif key == 'tags':
+                value = [value] if isinstance(value, str) else list(value)
+            item[key] = value
+        if option:
+            return item[option]
+        if not kwargs:
+            return {'text': item['text'], 'values': list(item['values']), 'tags': list(item['tags']),
+                    'open': item['open']}
+
+    def selection(self):
+        return self._selection
+
+    def selection_set(self, *items):
+        if len(items) == 1 and isinstance(items[0], (list, tuple)):
+            items = items[0]
+        self._selection = tuple(items)
+
+    def focus(self, iid=None):
+        if iid is None:
+            return self._focus
+        self._focus = iid
+
+    def see(self, iid):
+        pass
+
+    def yview(self, *args):
+        return 0., 1.
+
+    def yview_moveto(self, fraction):
+        pass
+
+    def xview(self, *args):
+        return 0., 1.
+
+    def identify_region(self, x, y):
+        return 'heading'
+
+    def identify_column(self, x):
+        return '#1'
+
+    def identify_row(self, y):
+        return ''
+
+    def get_values(self, item=''):
+        """
+        Returns the values of the attached children of item, in order (test helper).
+        """
+        return [self._items[iid]['values'] for iid in self._children[item]]
+
+
+class FakeWidget(object):
+
+    def __init__(self, master=None, **kwargs):
+        self.master = master
+
+    def grid(self, **kwargs):
+        pass
+
+    def configure(self, **kwargs):
+        pass
+
+    config = configure
+
+    def bind(self, sequence, func=None, add=None):
+        pass
+
+    def set(self, first, last):
+        pass
+
+
+class FakeVariable(object):
+
+    def __init__(self, master=None, value=''):
+        self._value = value
+        self._callbacks = []
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+        for callback in self._callbacks:
+            callback('', '', 'write')
+
+    def trace_add(self, mode, callback):
+        self._callbacks.append(callback)
+
+
+class FakeScheduler(object):
+    """
+    Collects the callbacks scheduled with after(). run() calls them (and the ones they schedule) in order.
+    """
+    def __init__(self):
+        self.jobs = collections.OrderedDict()
+        self._counter = itertools.count(1)
+
+    def after(self, ms, func=None, *args):
+        job = 'after#{}'.format(next(self._counter))
+        self.jobs[job] = (func, args)
+        return job
+
+    def after_cancel(self, job):
+        self.jobs.pop(job, None)
+
+    def run(self):
+        while self.jobs:
+            job, (func, args) = self.jobs.popitem(last=False)
+            func(*args)
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    """
+    Patches tkinter so that the widgets of tkinter_widgets can be created without a display. Trees are FakeTreeview
+    and callbacks scheduled with after() are run with scheduler.run().
+    """
+    scheduler = FakeScheduler()
+    monkeypatch.setattr(tk.Frame, '__init__', lambda self, master=None, **kwargs: None)
+    monkeypatch.setattr(tk.Frame, 'grid', lambda self, **kwargs: None)
+    monkeypatch.setattr(tk.Frame, 'after', lambda self, *args: scheduler.after(*args))
+    monkeypatch.setattr(tk.Frame, 'after_cancel', lambda self, job: scheduler.after_cancel(job))
+    monkeypatch.setattr(ttk, 'Treeview', FakeTreeview)
+    monkeypatch.setattr(ttk, 'Scrollbar', FakeWidget)
+    monkeypatch.setattr(ttk, 'Button', FakeWidget)
+    monkeypatch.setattr(tk, 'Label', FakeWidget)
+    monkeypatch.setattr(tk, 'Entry', FakeWidget)
+    monkeypatch.setattr(tk, 'StringVar', FakeVariable)
+    monkeypatch.setattr(tkinter_widgets, 'grid_configure', lambda frame, **kwargs: None)
+    return scheduler
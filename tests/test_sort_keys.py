@@ -0,0 +1,43 @@
+import pytest
+
+from shark_tkinter_lib.sort_keys import (natural_key, int_key, get_sort_key, sorted_items, sorted_int, clear_cache,
+                                         natural_keys)
+
+
+def test_natural_key():
+    assert sorted(['st10', 'St2', 'st1'], key=natural_key) == ['st1', 'St2', 'st10']
+
+
+def test_int_key():
+    assert int_key('12') == 12
+    assert int_key('x') is None
+    assert int_key(None) is None
+    assert int_key([1]) is None
+
+
+def test_sorted_int():
+    assert sorted_int(['10', '9', '100']) == ['9', '10', '100']
+    assert sorted_int(['10', '9', 'a1'], reverse=True) == ['a1', '10', '9']
+
+
+@pytest.mark.parametrize('kind, expected', [
+    ('natural', ['a2', 'A10', 'b1']),
+    ('str', ['A10', 'a2', 'b1']),
+])
+def test_sorted_items(kind, expected):
+    assert sorted_items(['b1', 'a2', 'A10'], kind=kind) == expected
+
+
+def test_get_sort_key_unknown_kind():
+    with pytest.raises(ValueError):
+        get_sort_key('unknown')
+
+
+def test_clear_cache():
+    natural_key('x1')
+    clear_cache()
+    assert natural_key('x1') == ('x', 1, '')
+
+
+def test_natural_keys():
+    assert natural_keys(['a2', 'A10', 'b']) == [natural_key('a2'), natural_key('A10'), natural_key('b')]
@@ -0,0 +1,293 @@
+import datetime
+import math
+import threading
+
+import numpy as np
+import pytest
+
+from shark_tkinter_lib.table_data import (TableData, get_row_diff, ColumnFilter, export_csv, SearchIndex, get_groups,
+                                          export_parquet, format_column, format_value, ColumnAggregate)
+
+
+def test_update_and_delete_rows_keep_ids():
+    data = TableData(['key', 'value'], rows=[(1, 'a'), (2, 'b'), (3, 'c'), (4, 'd')])
+    data.update_row(1, (2, 'x'))
+    assert data.get_row(1) == (2, 'x')
+    assert data.delete_rows([0, 2]).tolist() == [-1, 0, -1, 1]
+    assert [data.get_row(index) for index in range(2)] == [(2, 'x'), (4, 'd')]
+    assert data.get_iids([0, 1]) == ['1', '3']
+    data.add_rows([(5, 'e')])
+    assert data.get_iids([2]) == ['4']
+
+
+def test_get_row_diff():
+    data = TableData(['key', 'value'], rows=[(1, 'a'), (2, 'b'), (3, 'c')])
+    deleted, changed, added = get_row_diff(data, 'key', [(1, 'a'), (3, 'x'), (4, 'd')])
+    assert deleted == [1]
+    assert changed == [(2, (3, 'x'))]
+    assert added == [(4, 'd')]
+
+
+def test_column_store():
+    data = TableData(['key', 'value'], rows=[(1, 'a'), (2, 'b')])
+    assert data.add_columns([[3, 4], ['c', 'd']]) == range(2, 4)
+    assert data.get_value(2, 'value') == 'c'
+    assert data.get_row_dict(3) == {'key': 4, 'value': 'd'}
+    data.delete_rows([0])
+    assert data.get_index('1') == 0
+    assert data.get_index('3') == 2
+
+
+COLUMNS = ['key', 'station', 'depth', 'time']
+
+
+def get_data(**kwargs):
+    rows = [(1, 'st10', 5.0, datetime.datetime(2020, 1, 3)),
+            (2, 'st2', float('nan'), datetime.datetime(2020, 1, 1)),
+            (3, 'St1', 1.5, None),
+            (4, 'st2', -2.0, datetime.datetime(2020, 1, 2))]
+    return TableData(COLUMNS, rows=rows, **kwargs)
+
+
+FILTER_CASES = [
+    (ColumnFilter('depth', min_value=0), [0, 2]),
+    (ColumnFilter('depth', max_value=1.5), [2, 3]),
+    (ColumnFilter('station', equals='st2'), [1, 3]),
+    (ColumnFilter('key', equals=3), [2]),
+    (ColumnFilter('key', isin=[1, 4]), [0, 3]),
+    (ColumnFilter('station', isin=['st10', 'St1']), [0, 2]),
+    (ColumnFilter('station', contains='1'), [0, 2]),
+    (ColumnFilter('station', contains='st1', case_sensitive=False), [0, 2]),
+    (ColumnFilter('station', regex=r'^st\d$'), [1, 3]),
+    (ColumnFilter('station', regex=r'^ST\d$', case_sensitive=False), [1, 2, 3]),
+]
+
+
+@pytest.mark.parametrize('column_filter, expected', FILTER_CASES)
+def test_column_filter(column_filter, expected):
+    assert np.flatnonzero(column_filter.get_mask(get_data())).tolist() == expected
+
+
+def test_argsort_natural_and_str():
+    data = get_data(dtypes={'station': 'natural'})
+    assert data.argsort([('station', False), ('key', False)]).tolist() == [2, 1, 3, 0]
+    assert data.argsort([('station', True), ('key', False)]).tolist() == [0, 1, 3, 2]
+    data = TableData(['key'], rows=[('a',), ('B',), ('b',)])
+    assert data.argsort([('key', False)]).tolist() == [1, 0, 2]
+
+
+def test_argsort_is_stable_on_several_columns():
+    rows = [(k % 2, k % 3, k) for k in range(12)]
+    data = TableData(['a', 'b', 'c'], rows=rows, dtypes={'a': 'int', 'b': 'int', 'c': 'int'})
+    order = data.argsort([('a', True), ('b', False)])
+    assert [rows[k] for k in order] == sorted(rows, key=lambda row: (-row[0], row[1]))
+
+
+def test_export_csv(tmp_path):
+    data = get_data()
+    file_path = tmp_path / 'export.csv'
+    progress = []
+    values = [data.get_column_values(col) for col in data.columns]
+    assert export_csv(file_path, data.columns, values, [3, 0], chunk_size=1,
+                      callback_progress=lambda *args: progress.append(args), delimiter='\t')
+    lines = file_path.read_text(encoding='utf-8').splitlines()
+    assert lines == ['key\tstation\tdepth\ttime', '4\tst2\t-2.0\t2020-01-02 00:00:00',
+                     '1\tst10\t5.0\t2020-01-03 00:00:00']
+    assert progress == [(1, 2), (2, 2)]
+
+
+def test_export_csv_stops_on_event(tmp_path):
+    class Event(object):
+        def is_set(self):
+            return True
+
+    data = get_data()
+    values = [data.get_column_values(col) for col in data.columns]
+    assert not export_csv(tmp_path / 'export.csv', data.columns, values, [0, 1], stop_event=Event())
+
+
+def test_search_index():
+    index = SearchIndex()
+    index.add_rows([0, 1], [('Gothenburg', 'Baltic'), ('Stockholm', 'Baltic')])
+    assert index.search('holm') == {1}
+    assert index.search('baltic') == {0, 1}
+    assert index.search('x') == set()
+    index.remove_rows([1], [('Stockholm', 'Baltic')])
+    assert index.search('baltic') == {0}
+    assert index.search('holm') == set()
+
+
+def test_get_indices():
+    data = get_data()
+    data.delete_rows([0, 2])
+    data.add_rows([(5, 'st5', 0.0, None)])
+    assert data.get_indices(['1', '3', '4']).tolist() == [0, 1, 2]
+
+
+def test_get_groups():
+    data = get_data(dtypes={'station': 'natural'})
+    keys, starts, counts, rows = get_groups(data, ['station'], [0, 1, 2, 3])
+    assert keys == [('St1',), ('st2',), ('st10',)]
+    assert counts.tolist() == [1, 2, 1]
+    assert rows[starts[1]:starts[1] + counts[1]].tolist() == [1, 3]
+
+
+def test_column_hash():
+    assert get_data().get_column_hash('station') == get_data().get_column_hash('station')
+    data = get_data()
+    data.update_row(1, (2, 'st3', 0.0, None))
+    assert data.get_column_hash('station') != get_data().get_column_hash('station')
+    assert TableData(['a'], rows=[(1,)]).get_column_hash('a') != TableData(['a'], rows=[(1.0,)]).get_column_hash('a')
+    assert TableData(['a'], rows=[([1],)]).get_column_hash('a') is None
+
+
+def test_categorical_columns():
+    data = TableData(['key', 'station'], rows=[(k, 'st{}'.format(k % 3)) for k in range(12)], categorical='auto')
+    assert data.is_categorical('station')
+    assert not data.is_categorical('key')
+    assert data.get_column('station').tolist() == ['st{}'.format(k % 3) for k in range(12)]
+    data.delete_rows(range(6))
+    assert data.get_column('station').tolist() == ['st{}'.format(k % 3) for k in range(6, 12)]
+    assert data.get_row(0) == (6, 'st0')
+
+
+def test_version_changes_on_every_change():
+    data = get_data()
+    versions = [data.version]
+    data.update_row(0, (1, 'st1', 0.0, None))
+    versions.append(data.version)
+    data.delete_rows([0])
+    versions.append(data.version)
+    data.clear()
+    versions.append(data.version)
+    assert len(set(versions)) == len(versions)
+
+
+def test_search_index_prefix():
+    index = SearchIndex()
+    index.add_rows([0, 1], [('Gothenburg',), ('Stockholm',)])
+    assert index.search('holm', prefix=True) == set()
+    assert index.search('st', prefix=True) == {1}
+    assert index.search('g', prefix=True) == {0}
+
+
+def test_column_hash_with_nan():
+    assert get_data().get_column_hash('depth') == get_data().get_column_hash('depth')
+    data = get_data()
+    data.update_row(1, (2, 'st2', 0.0, None))
+    assert data.get_column_hash('depth') != get_data().get_column_hash('depth')
+
+
+def test_get_row_diff_nan_values_are_equal():
+    data = TableData(['key', 'value'], rows=[(1, float('nan')), (2, np.nan)])
+    assert get_row_diff(data, 'key', [(1, float('nan')), (2, float('nan'))]) == ([], [], [])
+    assert get_row_diff(data, 'key', [(1, float('nan')), (2, 0.0)]) == ([], [(1, (2, 0.0))], [])
+
+
+def test_export_parquet_mixed_and_empty_columns(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    columns = ['int', 'mixed', 'empty', 'float']
+    values = [[1, 2, 3], [1, 'a', None], [None, None, None], [1.5, None, 2.5]]
+    file_path = str(tmp_path / 'export.parquet')
+    assert export_parquet(file_path, columns, values, [0, 1, 2], chunk_size=2)
+    table = pq.read_table(file_path)
+    assert table.column('int').to_pylist() == [1, 2, 3]
+    assert table.column('mixed').to_pylist() == ['1', 'a', None]
+    assert table.column('empty').to_pylist() == [None, None, None]
+    assert table.column('float').to_pylist() == [1.5, None, 2.5]
+    assert pq.ParquetFile(file_path).num_row_groups == 2
+
+
+def test_export_parquet_removes_file_on_failure(tmp_path):
+    pytest.importorskip('pyarrow')
+    file_path = tmp_path / 'export.parquet'
+
+    def callback_progress(nr_rows, nr_total):
+        raise RuntimeError('stop')
+
+    with pytest.raises(RuntimeError):
+        export_parquet(str(file_path), ['a'], [[1, 2]], [0, 1], callback_progress=callback_progress)
+    assert not file_path.exists()
+
+
+def test_export_parquet_stopped(tmp_path, monkeypatch):
+    pq = pytest.importorskip('pyarrow.parquet')
+    closed = []
+    close = pq.ParquetWriter.close
+    monkeypatch.setattr(pq.ParquetWriter, 'close', lambda writer: closed.append(True) or close(writer))
+    file_path = tmp_path / 'export.parquet'
+    stop_event = threading.Event()
+    assert not export_parquet(str(file_path), ['a'], [[1, 2, 3]], [0, 1, 2], chunk_size=1,
+                              callback_progress=lambda nr_rows, nr_total: stop_event.set(), stop_event=stop_event)
+    assert closed
+    assert not file_path.exists()
+
+
+def test_short_rows_are_padded():
+    data = TableData(['a', 'b', 'c'])
+    assert data.add_rows([(1, 2), (3, 4, 5, 6)]) == range(0, 2)
+    assert data.get_row(0) == (1, 2, '')
+    assert data.get_row(1) == (3, 4, 5)
+    data.update_row(1, (3,))
+    assert data.get_row(1) == (3, '', '')
+    assert get_row_diff(data, 'a', [(1, 2), (3, 4)]) == ([], [(1, (3, 4, ''))], [])
+
+
+def test_format_value():
+    assert format_value(None) == ''
+    assert format_value(float('nan'), '%.2f') == ''
+    assert format_value(np.datetime64('NaT')) == ''
+    assert format_value(1.234, '%.1f') == '1.2'
+    assert format_value(math.inf, '%.1f') == 'inf'
+    assert format_value('text', '%.1f') == 'text'
+    assert format_value(3) == 3
+
+
+def test_format_column():
+    floats = np.array([1.25, np.nan, np.inf])
+    assert format_column(floats, '%.1f').tolist() == ['1.2', '', 'inf']
+    assert format_column(floats).tolist() == ['1.25', '', 'inf']
+    assert format_column(np.array([1, 2]), '%03d').tolist() == ['001', '002']
+    times = np.array(['2020-01-01T12:00', 'NaT'], dtype='datetime64[s]')
+    assert format_column(times).tolist() == ['2020-01-01 12:00:00', '']
+    objects = np.array([1.5, None, 'text', float('nan')], dtype=object)
+    assert format_column(objects, '%.2f').tolist() == ['1.50', '', 'text', '']
+
+
+@pytest.mark.parametrize('column_filter, expected', FILTER_CASES)
+def test_column_filter_on_categorical_column(column_filter, expected):
+    data = get_data(categorical=['station'])
+    assert np.flatnonzero(column_filter.get_mask(data)).tolist() == expected
+
+
+def test_column_filter_on_categorical_column_with_deleted_rows():
+    data = TableData(['station'], rows=[('a',), ('b',), ('a',), ('c',)], categorical=['station'])
+    data.delete_rows([0])
+    assert ColumnFilter('station', equals='a').get_mask(data).tolist() == [False, True, False]
+
+
+def test_argsort_places_missing_values_last():
+    data = get_data(dtypes={'key': 'int', 'depth': 'float', 'time': 'datetime'})
+    assert data.argsort([('depth', False)]).tolist() == [3, 2, 0, 1]
+    assert data.argsort([('depth', True)]).tolist() == [0, 2, 3, 1]
+    assert data.argsort([('time', False)]).tolist() == [1, 3, 0, 2]
+    assert data.argsort([('time', True)]).tolist() == [0, 3, 1, 2]
+    assert data.argsort([('key', True)]).tolist() == [3, 2, 1, 0]
+    assert data.argsort([]).tolist() == [0, 1, 2, 3]
+
+
+@pytest.mark.parametrize('categorical', [None, 'auto'])
+def test_column_aggregate_from_column(categorical):
+    data = TableData(['station', 'depth'], rows=[('st2', 5.0), ('st1', None), ('st2', 1.5), ('', -2.0)] * 2,
+                     dtypes={'depth': 'float'}, categorical=categorical)
+    mask = np.array([True, True, True, True, False, False, False, True])
+    for col in data.columns:
+        expected = ColumnAggregate()
+        expected.add(data.get_column(col)[mask])
+        aggregate = ColumnAggregate.from_column(data, col, mask=mask)
+        assert aggregate.get_stats() == expected.get_stats()
+        aggregate.remove([data.get_value(0, col)])
+        expected.remove([data.get_value(0, col)])
+        assert aggregate.get_stats() == expected.get_stats()
+    assert ColumnAggregate.from_column(data, 'station').get_stats() == {'count': 6, 'min': 'st1', 'max': 'st2',
+                                                                         'mean': None, 'distinct': 2}
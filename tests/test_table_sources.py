@@ -0,0 +1,145 @@
+import sqlite3
+
+import numpy as np
+import pytest
+
+from shark_tkinter_lib.table_data import ColumnFilter
+from shark_tkinter_lib.table_sources import SqliteTableSource, MemmapTableSource, MappedTableData
+
+
+ROWS = [('st10', 5.0), ('st2', None), ('St1', 1.5), ('st2', -2.0), ('st3', 0.5)]
+
+
+@pytest.fixture
+def sqlite_source():
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE data (station TEXT, "depth m" REAL)')
+    connection.executemany('INSERT INTO data VALUES (?, ?)', ROWS)
+    yield SqliteTableSource(connection, 'data', page_size=2, cache_size=2)
+    connection.close()
+
+
+def test_sqlite_get_rows(sqlite_source):
+    assert sqlite_source.columns == ['station', 'depth m']
+    assert len(sqlite_source) == 5
+    row_ids, rows = sqlite_source.get_rows(1, 4)
+    assert row_ids == [2, 3, 4]
+    assert rows == ROWS[1:4]
+    assert sqlite_source.get_rows(4, 10)[1] == ROWS[4:]
+    assert sqlite_source.get_row_dict(3) == {'station': 'St1', 'depth m': 1.5}
+    assert sqlite_source.get_row_dict(10) == {}
+
+
+def test_sqlite_sort_and_filter(sqlite_source):
+    sqlite_source.set_sort([('depth m', True)])
+    assert [row[1] for row in sqlite_source.iter_rows()][:4] == [5.0, 1.5, 0.5, -2.0]
+    sqlite_source.set_filters([ColumnFilter('station', equals='st2')])
+    assert len(sqlite_source) == 2
+    assert sqlite_source.get_rows(0, 2)[0] == [4, 2]
+    sqlite_source.set_filters([ColumnFilter('station', regex=r'^ST\d$', case_sensitive=False),
+                               ColumnFilter('depth m', min_value=1)], filter_mode='or')
+    assert len(sqlite_source) == 5
+    sqlite_source.set_filters([ColumnFilter('station', contains='1'), ColumnFilter('depth m', min_value=2)])
+    assert list(sqlite_source.iter_rows()) == [('st10', 5.0)]
+
+
+def test_sqlite_set_columns_and_aggregates(sqlite_source):
+    sqlite_source.set_columns(['depth m'])
+    assert sqlite_source.get_rows(0, 1)[1] == [(5.0,)]
+    stats = sqlite_source.get_aggregates()['depth m']
+    assert stats['count'] == 4
+    assert stats['min'] == -2.0
+    assert stats['max'] == 5.0
+    assert stats['mean'] == pytest.approx(1.25)
+    assert stats['distinct'] == 4
+
+
+@pytest.fixture
+def npy_path(tmp_path):
+    array = np.array([('st10', 5.0), ('st2', np.nan), ('St1', 1.5), ('st2', -2.0), ('st3', 0.5)],
+                     dtype=[('station', 'U8'), ('depth', 'f8')])
+    file_path = str(tmp_path / 'data.npy')
+    np.save(file_path, array)
+    return file_path
+
+
+def test_memmap_npy_get_rows(npy_path):
+    source = MemmapTableSource(npy_path)
+    assert source.columns == ['station', 'depth']
+    assert len(source) == 5
+    row_ids, rows = source.get_rows(1, 3)
+    assert row_ids == [1, 2]
+    assert rows[1] == ('St1', 1.5)
+    assert source.get_row_dict(3) == {'station': 'st2', 'depth': -2.0}
+    assert len(list(source.iter_rows(chunk_size=2))) == 5
+    with pytest.raises(KeyError):
+        source.set_columns(['missing'])
+
+
+def test_memmap_npy_aggregates(npy_path):
+    source = MemmapTableSource(npy_path)
+    stats = source.get_aggregates()
+    assert stats['depth'] == {'count': 4, 'min': -2.0, 'max': 5.0, 'mean': 1.25, 'distinct': 4}
+    assert stats['station']['distinct'] == 4
+    assert stats['station']['min'] == 'St1'
+    source.set_filters([ColumnFilter('station', equals='st2')])
+    assert source.get_aggregates()['depth']['count'] == 1
+
+
+def test_memmap_2d_npy(tmp_path):
+    file_path = str(tmp_path / 'data.npy')
+    np.save(file_path, np.arange(6, dtype=float).reshape(3, 2))
+    source = MemmapTableSource(file_path)
+    assert source.columns == ['0', '1']
+    source.set_sort([('1', True)])
+    assert source.get_rows(0, 3)[1] == [(4.0, 5.0), (2.0, 3.0), (0.0, 1.0)]
+
+
+def test_sqlite_get_row_ids(sqlite_source):
+    assert sqlite_source.get_row_ids(0, 2) == [1, 2]
+    sqlite_source.set_sort([('depth m', False)])
+    sqlite_source.set_filters([ColumnFilter('depth m', min_value=0)])
+    assert sqlite_source.get_row_ids(0, 10) == [5, 3, 1]
+
+
+def test_mapped_table_data_is_read_only():
+    data = MappedTableData({'a': np.arange(3), 'b': np.array(['x', 'y', 'z'])})
+    assert len(data) == 3
+    assert data.get_row(1) == (1, 'y')
+    assert data.get_row_dict(2) == {'a': 2, 'b': 'z'}
+    with pytest.raises(ValueError):
+        data.add_rows([(3, 'w')])
+    with pytest.raises(ValueError):
+        data.delete_rows([0])
+    with pytest.raises(ValueError):
+        data.update_row(0, (0, 'w'))
+
+
+def test_memmap_npy_sort_and_filter(npy_path):
+    source = MemmapTableSource(npy_path, dtypes={'station': 'natural'})
+    source.set_sort([('depth', False)])
+    assert source.get_row_ids(0, 5).tolist() == [3, 4, 2, 0, 1]
+    source.set_sort([('station', False), ('depth', True)])
+    assert source.get_row_ids(0, 5).tolist() == [2, 3, 1, 4, 0]
+    source.set_filters([ColumnFilter('station', equals='st2')])
+    assert source.get_rows(0, 10)[0] == [3, 1]
+    source.set_filters([ColumnFilter('depth', max_value=0.5), ColumnFilter('station', contains='10')],
+                       filter_mode='or')
+    assert len(source) == 3
+    source.set_sort([])
+    assert source.get_row_ids(0, 10).tolist() == [0, 3, 4]
+
+
+def test_memmap_arrow(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    table = pa.table({'station': ['st10', 'st2', None], 'depth': [5.0, None, 1.5]})
+    file_path = str(tmp_path / 'data.arrow')
+    with pa.ipc.new_file(file_path, table.schema) as writer:
+        writer.write_table(table)
+    source = MemmapTableSource(file_path, dtypes={'station': 'natural'})
+    assert source.get_rows(0, 3)[1] == [('st10', 5.0), ('st2', None), (None, 1.5)]
+    source.set_sort([('depth', False)])
+    assert source.get_row_ids(0, 3).tolist() == [2, 0, 1]
+    source.set_filters([ColumnFilter('station', contains='st')])
+    assert source.get_rows(0, 3)[0] == [0, 1]
+    assert source.get_aggregates()['depth']['count'] == 1
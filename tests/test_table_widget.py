@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from shark_tkinter_lib import tkinter_widgets
+from shark_tkinter_lib.tkinter_widgets import TableWidget
+
+
+ROWS = [('a', 1), ('b', 2), ('c', 3)]
+
+
+@pytest.fixture
+def table(scheduler):
+    table = TableWidget(None, columns=['key', 'value'], key_column='key', show_footer=True)
+    table.set_table(ROWS)
+    return table
+
+
+def get_recomputed_aggregates(table):
+    table._aggregates = None
+    return table.get_aggregates()
+
+
+def test_update_table_changed_sort_column(table):
+    table.sort_by(['value'])
+    table.update_table([('a', 1), ('b', 0), ('c', 3)])
+    assert [row['key'] for row in table.get_filtered_items()] == ['b', 'a', 'c']
+    assert table.tree.get_values() == [('b', 0), ('a', 1), ('c', 3)]
+
+
+def test_update_table_changed_and_added_rows(table):
+    table.add_format_rule('high', 'value', min_value=10)
+    table.get_aggregates()
+    table.update_table([('a', 1), ('b', 20), ('c', 3), ('d', 4)])
+    stats = table.get_aggregates()
+    assert stats['value']['count'] == 4
+    assert stats['value']['mean'] == pytest.approx(7.0)
+    assert stats == get_recomputed_aggregates(table)
+    assert table.tree.tag_has('high') == tuple(table._data.get_iids([1]))
+
+
+def test_update_table_changed_filter_column(table):
+    table.set_filter('value', max_value=2)
+    table.update_table([('a', 1), ('b', 5), ('c', 0), ('d', 2)])
+    assert [row['key'] for row in table.get_filtered_items()] == ['a', 'c', 'd']
+    assert table.get_aggregates() == get_recomputed_aggregates(table)
+
+
+def test_click_heading_twice_sorts_descending(scheduler):
+    table = TableWidget(None, columns=['key', 'value'], column_dtypes={'value': 'float'})
+    table.set_table([('a', 2.0), ('b', None), ('c', 1.0), ('d', 2.0)])
+    table._on_click_heading('value')
+    assert table.get_sort_columns() == [('value', False)]
+    table._on_click_heading('value')
+    assert table.get_sort_columns() == [('value', True)]
+    assert [row['key'] for row in table.get_filtered_items()] == ['a', 'd', 'c', 'b']
+    assert [values[0] for values in table.tree.get_values()] == ['a', 'd', 'c', 'b']
+
+
+def test_reload_reuses_order_and_mask(table, monkeypatch):
+    table.sort_by([('value', True)])
+    table.set_filter('key', contains='b', case_sensitive=False)
+    table.reset_table()
+    monkeypatch.setattr(table._data, 'argsort', lambda sort_columns: pytest.fail('argsort on unchanged reload'))
+    monkeypatch.setattr(table, '_update_mask', lambda: pytest.fail('mask computed on unchanged reload'))
+    table.set_table(ROWS)
+    assert [row['key'] for row in table.get_filtered_items()] == ['b']
+
+
+def test_reload_with_changed_rows(table):
+    table.sort_by([('value', True)])
+    table.set_filter('value', max_value=2)
+    table.reset_table()
+    table.set_table([('a', 1), ('b', 0), ('c', 2)])
+    assert [row['key'] for row in table.get_filtered_items()] == ['c', 'a', 'b']
+    table.reset_table()
+    table.set_table([('a', 1), ('b', 0)])
+    assert [row['key'] for row in table.get_filtered_items()] == ['a', 'b']
+
+
+def test_set_table_frame_formats_per_chunk(scheduler, monkeypatch):
+    lengths = []
+    format_column = tkinter_widgets.format_column
+
+    def record_format_column(values, fmt=None):
+        lengths.append(len(values))
+        return format_column(values, fmt)
+
+    monkeypatch.setattr(tkinter_widgets, 'format_column', record_format_column)
+    table = TableWidget(None, columns=['key', 'value'], formats={'value': '%.1f'})
+    progress = []
+    frame = np.array([('a', 1.25), ('b', np.nan), ('c', 3.0)], dtype=[('key', 'U1'), ('value', 'f8')])
+    table.set_table_frame(frame, chunk_size=2, callback_progress=lambda nr, total: progress.append(nr))
+    scheduler.run()
+    assert progress == [2, 3]
+    assert max(lengths) == 2
+    assert table.tree.get_values() == [('a', '1.2'), ('b', ''), ('c', '3.0')]
+
+
+@pytest.fixture
+def search_table(scheduler, monkeypatch):
+    monkeypatch.setattr(TableWidget, 'SEARCH_INDEX_CHUNK_SIZE', 10)
+    table = TableWidget(None, columns=['key', 'value'], key_column='key', search_box=True)
+    table.set_table([('k{}'.format(k), 'v{}'.format(k)) for k in range(25)])
+    return table
+
+
+def test_search_index_built_in_chunks(search_table, scheduler):
+    assert search_table._nr_indexed == 0
+    scheduler.run()
+    assert search_table._nr_indexed == 25
+    search_table.search_var.set('V2')
+    assert sorted(search_table._search_ids) == [2, 20, 21, 22, 23, 24]
+
+
+def test_search_with_partial_index(search_table, scheduler):
+    job, (func, args) = scheduler.jobs.popitem(last=False)
+    func(*args)
+    assert search_table._nr_indexed == 10
+    rows = [('k{}'.format(k), 'v{}'.format(k)) for k in range(1, 25)]
+    rows[0] = ('k1', 'changed')
+    search_table.update_table(rows)
+    assert search_table._nr_indexed == 9
+    assert search_table.search('v2') == 6
+    assert search_table.search('v1') == 10
+    assert search_table.search('changed') == 1
+    assert not scheduler.jobs
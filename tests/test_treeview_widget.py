@@ -0,0 +1,110 @@
+from shark_tkinter_lib.tkinter_widgets import TreeviewWidget
+
+
+TREE = {'b': {'value': 2, 'children': {'b1': {'value': 21}, 'b10': {}, 'b2': {'children': {'x': {}}}}},
+        'a': {'value': 1}}
+
+
+def get_widget(**kwargs):
+    return TreeviewWidget(None, columns=['name', 'value'], **kwargs)
+
+
+def open_node(widget, key):
+    widget.tree.focus(key)
+    widget.tree.item(key, open=True)
+    widget._on_tree_open()
+
+
+def close_node(widget, key):
+    widget.tree.focus(key)
+    widget.tree.item(key, open=False)
+    widget._on_tree_close()
+
+
+def test_lazy_tree_inserts_children_when_opened(scheduler):
+    widget = get_widget(lazy=True)
+    widget.set_treeview_dict(TREE)
+    tree = widget.tree
+    assert tree.get_children('') == ('_a', '_b')
+    assert tree.get_children('_b') == ('_b_',)
+    open_node(widget, '_b')
+    assert tree.get_children('_b') == ('_b_b1', '_b_b2', '_b_b10')
+    assert tree.item('_b_b1', 'values') == (21,)
+    assert tree.get_children('_b_b2') == ('_b_b2_',)
+
+
+def test_lazy_tree_release_collapsed(scheduler):
+    widget = get_widget(lazy=True, release_collapsed=True)
+    widget.set_treeview_dict(TREE)
+    open_node(widget, '_b')
+    open_node(widget, '_b_b2')
+    close_node(widget, '_b')
+    assert widget.tree.get_children('_b') == ('_b_',)
+    assert not widget.tree.exists('_b_b2_x')
+    assert '_b_b2' not in widget._nodes
+    open_node(widget, '_b')
+    assert widget.tree.get_children('_b_b2') == ('_b_b2_',)
+
+
+def test_children_provider(scheduler):
+    paths = []
+
+    def children_provider(path):
+        paths.append(path)
+        return {'c{}'.format(k): {'value': k} for k in range(3)}
+
+    widget = get_widget(lazy=True, children_provider=children_provider)
+    widget.set_treeview_dict({'root': {'children': None}})
+    assert not paths
+    open_node(widget, '_root')
+    assert paths == [('root',)]
+    assert widget.tree.get_children('_root') == ('_root_c0', '_root_c1', '_root_c2')
+
+
+def test_find_shows_node_in_lazy_tree(scheduler):
+    widget = get_widget(lazy=True)
+    widget.set_treeview_dict(TREE)
+    assert widget.find('X') == [('b', 'b2', 'x')]
+    assert widget.tree.selection() == ('_b_b2_x',)
+    assert widget.tree.item('_b', 'open') and widget.tree.item('_b_b2', 'open')
+    assert widget.get_item_id(['b', 'b10']) == '_b_b10'
+    assert widget.find('b1', prefix=True, show=False) == [('b', 'b1'), ('b', 'b10')]
+
+
+def test_set_treeview_dict_applies_difference(scheduler):
+    widget = get_widget()
+    widget.set_treeview_dict(TREE)
+    tree = widget.tree
+    tree.item('_b', open=True)
+    widget.set_treeview_dict({'b': {'value': 3, 'children': {'b1': {'value': 21}, 'b3': {'children': {}}}},
+                              'c': {'value': 4}})
+    assert tree.get_children('') == ('_b', '_c')
+    assert tree.get_children('_b') == ('_b_b1', '_b_b3')
+    assert tree.item('_b', 'values') == (3,)
+    assert tree.item('_b', 'open')
+    assert not tree.exists('_a') and not tree.exists('_b_b2_x')
+    assert set(widget._nodes) == {'_b', '_b_b1', '_b_b3', '_c'}
+    assert widget.find('x', show=False) == []
+    widget.set_treeview_dict({'b': {'value': 3}})
+    assert tree.get_children('_b') == ()
+    assert set(widget._nodes) == {'_b'}
+
+
+def test_unchanged_dict_only_lists_inserted_levels(scheduler):
+    widget = get_widget(lazy=True)
+    widget.set_treeview_dict(TREE)
+    open_node(widget, '_b')
+    widget.tree.calls.clear()
+    widget.set_treeview_dict(TREE)
+    # The top level and the opened node, not the closed b2 with a placeholder
+    assert widget.tree.calls == {'get_children': 2}
+    assert widget.tree.get_children('_b_b2') == ('_b_b2_',)
+
+
+def test_lazy_update_of_closed_node(scheduler):
+    widget = get_widget(lazy=True)
+    widget.set_treeview_dict({'a': {'value': 1}})
+    widget.set_treeview_dict({'a': {'value': 1, 'children': {'a1': {}}}})
+    assert widget.tree.get_children('_a') == ('_a_',)
+    open_node(widget, '_a')
+    assert widget.tree.get_children('_a') == ('_a_a1',)